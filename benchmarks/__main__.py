@@ -0,0 +1,45 @@
+# The bench_* modules follow asv's layout, classes with setup() and time_* methods over
+# params, so `asv run` picks them up. Without asv they can be timed directly:
+#
+#   python -m benchmarks [name filter] [repeats]
+import importlib
+import itertools
+import pkgutil
+import sys
+import timeit
+
+import benchmarks
+
+
+def _cases():
+    for info in pkgutil.iter_modules(benchmarks.__path__):
+        if not info.name.startswith("bench_"):
+            continue
+        module = importlib.import_module("benchmarks." + info.name)
+        for cls in vars(module).values():
+            if not isinstance(cls, type) or cls.__module__ != module.__name__:
+                continue
+            for method in sorted(m for m in vars(cls) if m.startswith("time_")):
+                params = getattr(cls, "params", [])
+                for combo in itertools.product(*params):
+                    yield "{}.{}.{}".format(info.name, cls.__name__, method), cls, method, combo
+
+
+def main(pattern="", repeats=5):
+    repeats = int(repeats)
+    for name, cls, method, combo in _cases():
+        label = name + ("({})".format(", ".join(map(repr, combo))) if combo else "")
+        if pattern not in label:
+            continue
+        bench = cls()
+        times = []
+        for _ in range(repeats):
+            # setup is not timed, and runs again for every repeat as it does in asv
+            if hasattr(bench, "setup"):
+                bench.setup(*combo)
+            times.append(timeit.timeit(lambda: getattr(bench, method)(*combo), number=1))
+        print("{:<70} {:12.3f} ms".format(label, 1000 * min(times)))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,49 @@
+# Per step overhead of the experiment loops
+import pyerf
+
+from .models import WalkExperiment
+
+
+class OptimalRun:
+    params = [[False, True]]
+    param_names = ["tracking"]
+
+    def setup(self, tracking):
+        self.core = pyerf.Core(WalkExperiment(tracking=tracking, trial_length=10000), mode="optimal")
+
+    def time_run(self, tracking):
+        self.core._initialize()
+        self.core.run()
+
+
+# experiment that stops the timed loop after a fixed number of iterations
+class _StoppingExperiment(WalkExperiment):
+    def __init__(self, steps):
+        super().__init__(trial_length=steps)
+        self.core = None
+
+    def iterate(self):
+        super().iterate()
+        if self.simulation.i + 1 >= self.trial_length:
+            self.core._kill = True
+            self.core.reset()
+
+
+# the same iterations as OptimalRun with tracking, but through the pause condition,
+# iteration lock and timer of _run_timed. Compare the two for the per iteration overhead,
+# which steps_per_sync amortizes
+class SafeRun:
+    steps = 10000
+    params = [[1, 10, 100]]
+    param_names = ["steps_per_sync"]
+
+    def setup(self, steps_per_sync):
+        experiment = _StoppingExperiment(self.steps)
+        # speed high enough that the timer never sleeps
+        self.core = pyerf.Core(experiment, mode="safe", speed=1e12, steps_per_sync=steps_per_sync)
+        experiment.core = self.core
+
+    def time_run_timed(self, steps_per_sync):
+        self.core._kill = False
+        self.core._initialize()
+        self.core._run_timed()
@@ -0,0 +1,16 @@
+# Cost of recording tracked variables each step
+from .models import walked
+
+
+class UpdateTrackHist:
+    params = [[1, 10, 100], [0, 100000]]
+    param_names = ["n_vars", "history"]
+
+    def setup(self, n_vars, history):
+        self.simulation = walked(history, n_vars)
+
+    def time_update_track_hist(self, n_vars, history):
+        simulation = self.simulation
+        i = simulation.i
+        for k in range(1000):
+            simulation.update_track_hist(i + k)
@@ -0,0 +1,53 @@
+# Cost of a frame of the time series visuals against histories of different lengths.
+# Both are built without a window: the vispy canvas is never shown and BaseTS draws
+# into Agg, so this is the cost of preparing the frame, not of putting it on screen
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from pyerf.visuals import BaseTS, BaseVispyTS
+
+from .models import walked
+
+
+def _var(simulation):
+    return (lambda s: s.walker, simulation, "x0")
+
+
+# a few more steps after the visual has drawn once, so the timed frame is a steady state
+# one: incremental work on the new samples rather than the first full build, e.g. of the
+# lod pyramid
+def _advance(simulation, steps=10):
+    for _ in range(steps):
+        simulation.iterate()
+        simulation._iterate_bookkeeping()
+
+
+class VispyTSIterate:
+    params = [[1000, 100000, 1000000], [False, True]]
+    param_names = ["history", "lod"]
+
+    def setup(self, history, lod):
+        simulation = walked(history)
+        self.visual = BaseVispyTS(None, [_var(simulation)], lod=lod)
+        self.visual.iterate()
+        _advance(simulation)
+
+    def time_iterate(self, history, lod):
+        self.visual.iterate()
+
+
+class AggTS(BaseTS):
+    canvas_class = FigureCanvasAgg
+
+
+class TSUpdateTriggered:
+    params = [[1000, 100000, 1000000], [False, True]]
+    param_names = ["history", "lod"]
+
+    def setup(self, history, lod):
+        simulation = walked(history)
+        self.visual = AggTS([_var(simulation)], lod=lod, figsize=(400, 300))
+        self.visual.update_triggered()
+        _advance(simulation)
+
+    def time_update_triggered(self, history, lod):
+        self.visual.update_triggered()
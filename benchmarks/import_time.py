@@ -0,0 +1,36 @@
+# Startup cost of a headless worker: import pyerf and build an optimal mode Core.
+# Fails if any of the gui, plotting or cli packages get loaded along the way.
+#
+#   python benchmarks/import_time.py [repeats]
+import subprocess
+import sys
+import time
+
+HEAVY = ["PyQt5", "vispy", "matplotlib", "IPython"]
+
+WORKER = """
+import sys
+import pyerf
+pyerf.Core(pyerf.Experiment(pyerf.Simulation()), mode="optimal")
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+""".format(heavy=HEAVY)
+
+
+def main(repeats=10):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-c", WORKER], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        times.append(time.perf_counter() - start)
+        if out:
+            sys.exit("optimal mode imported: {}".format(out))
+    times.sort()
+    print("import + optimal Core: min {:.1f} ms, median {:.1f} ms over {} runs".format(
+        1000 * times[0], 1000 * times[len(times) // 2], repeats
+    ))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
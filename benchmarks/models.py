@@ -0,0 +1,42 @@
+# Small models shared by the benchmarks, cheap enough that the framework dominates
+import pyerf
+
+
+class Walker(pyerf.Entity):
+    def __init__(self, n_vars=1):
+        super().__init__()
+        self.n_vars = n_vars
+        self.initialize()
+
+    def initialize(self):
+        for k in range(self.n_vars):
+            vars(self)["x{}".format(k)] = 0.0
+
+
+class WalkSimulation(pyerf.Simulation):
+    def __init__(self, n_vars=1, tracking=True):
+        super().__init__(tracking=tracking)
+        self.n_vars = n_vars
+        self.walker = Walker(n_vars)
+        self.robots.append(self.walker)
+        if tracking:
+            for k in range(n_vars):
+                self.walker.track_variable("x{}".format(k))
+
+    def iterate(self):
+        self.walker.x0 += self.rng.standard_normal()
+
+
+class WalkExperiment(pyerf.Experiment):
+    def __init__(self, n_vars=1, tracking=True, trial_length=1000):
+        super().__init__(WalkSimulation(n_vars, tracking), trial_length=trial_length)
+
+    def initialize(self):
+        self.simulation.__init__(self.simulation.n_vars, self.simulation.tracking)
+
+
+# simulation with n steps of history already tracked
+def walked(n, n_vars=1):
+    experiment = WalkExperiment(n_vars, trial_length=n)
+    experiment.run()
+    return experiment.simulation
@@ -49,17 +49,17 @@ class Parameters:
 
 
 class Arena(pyerf.Entity):
-    def __init__(self, n=8, r=3):
-        super().__init__()
+    def __init__(self, n=8, r=3, rng=None):
+        super().__init__(rng)
         self.size = n * r
-        self.grid = np.random.randint(0, 1, (self.size, self.size)).astype(np.float64)
+        self.grid = self.rng.integers(0, 1, (self.size, self.size)).astype(np.float64)
         self.n = n
         self.r = r
 
 
 class Robot(pyerf.Entity):
-    def __init__(self, world, pos=np.array([3, 3]), bearing=0, hist=None):
-        super().__init__()
+    def __init__(self, world, pos=np.array([3, 3]), bearing=0, hist=None, rng=None):
+        super().__init__(rng)
         self.SO = SensorimotorOptions()
         self.params = Parameters()
         self.bundle = Bundle(self.SO, self.params)
@@ -168,10 +168,10 @@ class Robot(pyerf.Entity):
 class Model(pyerf.Simulation):
     def __init__(self):
         super().__init__(tracking = True)
-        self.arena = Arena()
+        self.arena = Arena(rng=self.spawn_rng())
         self.environment = self.arena
-        self.robot = Robot(self.arena)
-        self.robot2 = Robot(self.arena)
+        self.robot = Robot(self.arena, rng=self.spawn_rng())
+        self.robot2 = Robot(self.arena, rng=self.spawn_rng())
         self.robot.partner = self.robot2
         self.robot2.partner = self.robot
         self.robots.append(self.robot)
@@ -1,7 +1,35 @@
+from importlib import import_module
+
 from .core import Core
-from .gui import GUI
-from .visuals import BaseMPL, BaseTS, BaseVispy, BaseVispyTS
 from .experiment import Experiment
 from .simulation import Simulation
+from .batch import BatchSimulation
 from .entity import Entity
-from .interface import CLI
+from .population import Population, Agent
+from .tracking import TrackedHistory
+from .sweep import Sweep
+from .trace import Trace, ReplayExperiment
+from .profiling import Profiler
+
+# These pull in PyQt5, vispy, matplotlib or IPython, so they are only imported on first
+# use. A headless optimal mode Core never touches them
+_LAZY = {
+    "GUI": ".gui",
+    "BaseMPL": ".visuals",
+    "BaseTS": ".visuals",
+    "BaseVispy": ".visuals",
+    "BaseVispyTS": ".visuals",
+    "StatsVisual": ".visuals",
+    "CLI": ".interface",
+    "Renderer": ".render",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(import_module(_LAZY[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
@@ -0,0 +1,38 @@
+import numpy as np
+
+from .rng import generator
+from .simulation import Simulation
+
+
+# Simulation of N independent replicas advanced in lockstep. State is kept with a leading
+# replica axis, e.g. a Population of n=self.replicas, so one numpy call steps every
+# replica. Each replica draws from its own generator, spawned from the simulation seed,
+# and tracked columns hold all replicas, split back out with replica(k)
+class BatchSimulation(Simulation):
+    def __init__(self, replicas=None, environment=None, tracking=False):
+        # like the rng, kept across the re-init that initialize() usually does
+        if replicas is not None or not hasattr(self, "replicas"):
+            self.replicas = replicas if replicas is not None else 1
+        super().__init__(environment, tracking)
+
+    def seed_rng(self, seed=None):
+        super().seed_rng(seed)
+        self.replica_seeds = self._seed_seq.spawn(self.replicas)
+        self.rngs = [generator(child) for child in self.replica_seeds]
+
+    # one draw per replica from its own stream, stacked along the replica axis,
+    # e.g. self.draw("normal", 0, 1, size=2) has shape (replicas, 2)
+    def draw(self, method, *args, **kwargs):
+        return np.stack([getattr(rng, method)(*args, **kwargs) for rng in self.rngs])
+
+    # {name: (steps, values)} of every tracked variable for replica k alone. Histories
+    # without a leading replica axis, e.g. a scalar shared by all replicas, are passed
+    # through whole
+    def replica(self, k):
+        replicas = {}
+        for name, hist in self.tracked_histories().items():
+            steps, values = hist.steps, hist.values
+            if values.ndim > 1 and values.shape[1] == self.replicas:
+                values = values[:, k]
+            replicas[name] = (steps, values)
+        return replicas
@@ -0,0 +1,95 @@
+import copyreg
+import io
+import os
+import pickle
+from threading import Thread
+
+import numpy as np
+
+from .tracking import TrackedHistory
+
+
+# Checkpoints are a directory holding state.pkl, a pickle of the experiment, and one .npy
+# blob per large array in it. Pickling happens in the caller's thread, in between
+# iterations, but the arrays are only referenced there and written out by a background
+# thread, so a big history costs the experiment little more than a small one.
+#
+# Tracked histories only ever append, so their frozen() views can be written while the
+# experiment keeps running. Any other large array could be changed in place by the next
+# iteration and is copied first. Arrays under inline bytes are simply pickled
+class _Pickler(pickle.Pickler):
+    def __init__(self, file, inline):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.inline = inline
+        self.blobs = {}
+        self._frozen = {}
+
+    def reducer_override(self, obj):
+        if type(obj) is not TrackedHistory:
+            return NotImplemented
+        state = obj.__getstate__()
+        for key in ("_steps", "_values"):
+            if state[key] is not None:
+                # keep a reference so the id can't be reused before dump finishes
+                self._frozen[id(state[key])] = state[key]
+        return copyreg.__newobj__, (TrackedHistory,), state
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray) or obj.dtype == object or obj.nbytes < self.inline:
+            return None
+        if id(obj) not in self.blobs:
+            mapped = id(obj) in self._frozen
+            name = "{:06d}.npy".format(len(self.blobs))
+            self.blobs[id(obj)] = (name, mapped, obj if mapped else obj.copy())
+        name, mapped, _ = self.blobs[id(obj)]
+        return name, mapped
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, path, mmap):
+        super().__init__(file)
+        self.path = path
+        self.mmap = mmap
+
+    # history blobs are mapped read only, a history copies them on its first append.
+    # anything else is state the model may write to, so it is loaded
+    def persistent_load(self, pid):
+        name, mapped = pid
+        mode = "r" if mapped and self.mmap else None
+        return np.load(os.path.join(self.path, name), mmap_mode=mode)
+
+
+def _write(path, data, blobs):
+    for name, _, array in blobs:
+        np.save(os.path.join(path, name), array)
+    # state.pkl goes last, a checkpoint without it is incomplete
+    with open(os.path.join(path, "state.pkl.tmp"), "wb") as f:
+        f.write(data)
+    os.replace(os.path.join(path, "state.pkl.tmp"), os.path.join(path, "state.pkl"))
+
+
+# returns the writer thread, or None when background=False and everything is on disk
+def save(experiment, path, background=True, inline=1 << 16):
+    os.makedirs(path, exist_ok=True)
+    buf = io.BytesIO()
+    pickler = _Pickler(buf, inline)
+    pickler.dump(experiment)
+    blobs = list(pickler.blobs.values())
+    if not background:
+        _write(path, buf.getvalue(), blobs)
+        return None
+    writer = Thread(target=_write, args=(path, buf.getvalue(), blobs), name="checkpoint")
+    writer.start()
+    return writer
+
+
+# the experiment as it was saved. A seed reseeds it, to fork a run that diverges from the
+# checkpoint instead of repeating it
+def load(path, mmap=True, seed=None):
+    if not os.path.exists(os.path.join(path, "state.pkl")):
+        raise FileNotFoundError("{} is not a complete checkpoint".format(path))
+    with open(os.path.join(path, "state.pkl"), "rb") as f:
+        experiment = _Unpickler(f, path, mmap).load()
+    if seed is not None:
+        experiment.seed_rng(seed)
+    return experiment
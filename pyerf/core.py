@@ -1,9 +1,60 @@
-from threading import Thread, Lock, Condition, Event
+from collections import deque
+from concurrent.futures import Future
+from threading import Thread, Lock, Condition, Event, get_ident
 import time
-import numpy as np
 
-from .gui import GUI
-from .interface import CLI
+from . import checkpoint
+from .batch import BatchSimulation
+from .pacing import Pacer
+from .profiling import Profiler
+from .rng import generator, new_seed
+
+
+# Event for the gui's go ahead to the experiment. The gui clears it again at the start of
+# its next frame, so a waiter goes by the count of sets rather than the flag: taken before
+# asking for a frame, no set can be missed however soon it is cleared. A waiter also
+# wakes when pending() turns true, e.g. for commands queued while the gui is paused
+class _Handover:
+    def __init__(self):
+        self._condition = Condition(Lock())
+        self._flag = False
+        self.sets = 0
+
+    def set(self):
+        with self._condition:
+            self._flag = True
+            self.sets += 1
+            self._condition.notify_all()
+
+    def clear(self):
+        with self._condition:
+            self._flag = False
+
+    def is_set(self):
+        return self._flag
+
+    # blocks until set, or set since the count was `sets`, or until pending() is true.
+    # Returns whether it was set
+    def wait(self, sets=None, pending=None):
+        with self._condition:
+            if sets is None:
+                sets = self.sets
+            while not self._flag and self.sets == sets and not (pending is not None and pending()):
+                self._condition.wait()
+            return self._flag or self.sets != sets
+
+    def wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+
+# swap in the attributes of state without obj ever being empty or missing one it keeps,
+# the gui may be reading it meanwhile
+def _replace_vars(obj, state):
+    attrs = vars(obj)
+    attrs.update(state)
+    for name in [name for name in attrs if name not in state]:
+        del attrs[name]
 
 
 class Core:
@@ -14,93 +65,353 @@ class Core:
         if self._mode not in mode_ops:
             print("mode should be in {}".format(mode_ops))
             self._mode = "safe"
-        self.seed = kwargs.get("seed", np.random.randint(2**32))
-        np.random.seed(self.seed)
+        self.seed = kwargs.get("seed", new_seed())
         self._kill = False
         self._unsynced_wait = False
         self._unsynced_wait_ready = False
 
         self.experiment = experiment
+        self.profiler = None
+        # N replicas of a BatchSimulation run in lockstep, each with its own seeded stream
+        self.replicas = kwargs.get("replicas", None)
+        if self.replicas is not None:
+            if not isinstance(experiment.simulation, BatchSimulation):
+                raise TypeError("replicas needs the experiment to use a BatchSimulation")
+            experiment.simulation.replicas = self.replicas
+        self._seed_rng()
+        if self._mode == "optimal":
+            # the experiment was built before it was seeded, so rngs handed to entities
+            # and any replica axis only follow the seed once it is rebuilt
+            self._initialize()
+        # gui and cli modules are heavy, so only imported by the modes that use them
         if self._mode != "optimal":
+            from .interface import CLI
             self.interface = CLI(self)
+        if kwargs.get("profile", False):
+            self.profile()
+        # checkpoint every n iterations, path is formatted with the simulation's i
+        self.checkpoint_every = kwargs.get("checkpoint_every", None)
+        self.checkpoint_path = kwargs.get("checkpoint_path", "checkpoints/{i:08d}")
+        self._since_checkpoint = 0
+        self._checkpoint_writer = None
         if self._mode in ["visual", "safe"]:
             self._initialize()
             self._is_reset = False
             self._paused = False
             self._pause_condition = Condition(Lock())
             self.framesync = kwargs.get("framesync", False)
-            self._speed = 1 / kwargs.get("speed", 1000)
-            self.time = time.time()
-            # lock to ensure that write interactions only occur in between iterations
-            self._iteration_lock = Lock()
+            # what to do when the experiment falls behind speed, see Pacer
+            self._pacer = Pacer(kwargs.get("speed", 1000), kwargs.get("pacing", "skip"))
+            # iterations per lock acquisition and gui handshake, see steps_per_sync()
+            self._steps_per_sync = kwargs.get("steps_per_sync", 1)
+            # write interactions are queued and run by the experiment thread in between
+            # iterations, see submit()
+            self._commands = deque()
+            self._loop_ident = None
+            # unthrottled fast forward, see turbo()
+            self._turbo = False
+            self._turbo_frame = False
         if self._mode in ["visual"]:
             self._sync_guiturn = Event()
             self._sync_guiturn.set()
-            self._sync_expturn = Event()
+            self._sync_expturn = _Handover()
             self._fps = 1000 // kwargs.get("fps", 60)
-            self.gui = GUI(self, self._fps)
+            # unless framesynced, the gui renders the latest published snapshot without waiting
+            self._snapshots = kwargs.get("snapshot", False)
+            self.snapshot = None
+            # the gui asks for the next snapshot once it has taken the last one, so there is
+            # at most one per frame rather than one per iteration
+            self._snapshot_wanted = True
             self._gui_reset_trigger = False
+            # gui in a forked process, fed through shared memory, see RemoteGUI
+            self._gui_process = kwargs.get("gui_process", False)
+            if self._gui_process:
+                if self.framesync:
+                    print("framesync is not available with gui_process, using snapshots")
+                self.framesync = False
+                self._snapshots = True
+                from .remote import RemoteGUI
+                self.gui = RemoteGUI(
+                    self, self._fps, kwargs.get("gui_state", ()), kwargs.get("gui_history", 100000)
+                )
+            else:
+                from .gui import GUI
+                self.gui = GUI(self, self._fps)
 
 
     def _run_timed(self):
+        self._loop_ident = get_ident()
         while True:
             self._is_reset = False
+            self._publish_snapshot(force=True)
             self._gui_reset_trigger = True
+            self._pacer.reset()
             # Condition is set false when reset is called, continuing the outer loop
             while not self._is_reset:
-                if self.framesync or not self._sync_expturn.is_set():
-                    self._sync_guiturn.set()
-                    self._sync_expturn.wait()
-                    if self.framesync:
+                turbo = self._turbo
+                # in turbo the gui only asks for a frame when _turbo_step offers one
+                if self._mode == "visual" and ((self.framesync and not turbo) or (
+                        not self._snapshots and not self._sync_expturn.is_set())):
+                    self._wait_expturn()
+                    if self.framesync and not turbo:
                         self._sync_expturn.clear()
 
+                # the only per iteration checks, no locks unless there is something to do
+                if self._commands:
+                    self._run_commands()
                 # Handle pause from interfaces
-                with self._pause_condition:
-                    while self._paused:
-                        self._pause_condition.wait()
-                    with self._iteration_lock:
-                        self.experiment._iterate()
+                if self._paused:
+                    self._wait_unpaused()
+
+                profiler = self.profiler
+                for _ in range(self._steps_per_sync):
+                    if profiler is not None:
+                        profiler.tick("step")
+                    self.experiment._iterate()
+                    if self.checkpoint_every is not None:
+                        self._checkpoint_due()
+                    if turbo:
+                        self._turbo_step()
+                        if not self._turbo:
+                            break
+                if not turbo:
+                    self._publish_snapshot()
 
                 # If unsynced use own timer 
-                if not self.framesync:
-                    time_diff = time.time() - self.time
-                    # If the code is running slower than the timer, don't force the wait
-                    if time_diff < self._speed:
-                        time.sleep(self._speed - time_diff)
-                    self.time = time.time()
+                if not self.framesync and not turbo:
+                    self._pacer.wait(self._steps_per_sync)
             if self._kill:
+                self._loop_ident = None
                 return
             else: 
                 self._initialize()
 
-    def _run_untimed(self):
-        self.experiment.run()
+    def _publish_snapshot(self, force=False):
+        if self._mode == "visual" and self._gui_process:
+            self.gui.publish()
+        elif self._mode == "visual" and self._snapshots and (force or self._snapshot_wanted):
+            self._snapshot_wanted = False
+            # a single reference swap, the gui keeps whichever snapshot it is drawing
+            self.snapshot = self.experiment.snapshot()
+
+    # the experiment and simulation get generators spawned from the seed,
+    # nothing touches the global numpy rng
+    def _seed_rng(self):
+        self.rng = generator(self.seed)
+        self.experiment.seed_rng(self.seed)
 
     def _initialize(self):
-        np.random.seed(self.seed)
+        self._seed_rng()
         self.experiment._initialize()
+        if self.profiler is not None:
+            # initialize may have swapped out the simulation
+            self.profiler.attach(self.experiment)
+
+    # turn the hot path timers on or off, see Profiler
+    def profile(self, on=True):
+        if on:
+            if self.profiler is None:
+                self.profiler = Profiler()
+            self.profiler.attach(self.experiment)
+        elif self.profiler is not None:
+            self.profiler.detach(self.experiment)
+            self.profiler = None
+
+    def _run_untimed(self):
+        if self.profiler is None and self.checkpoint_every is None:
+            self.experiment.run()
+            return
+        for _ in range(self.experiment.trial_length):
+            if self.profiler is not None:
+                self.profiler.tick("step")
+            self.experiment._iterate()
+            if self.checkpoint_every is not None:
+                self._checkpoint_due()
+        self._join_checkpoint()
+
+    def _checkpoint_due(self):
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self._since_checkpoint = 0
+            self._checkpoint(self.checkpoint_path.format(i=self.experiment.simulation.i))
+
+    # write the full experiment state to path, arrays are written in the background.
+    # between iterations, so blocks until the current one finishes
+    def checkpoint(self, path):
+        self.submit(self._checkpoint, path).result()
+        return path
+
+    def _checkpoint(self, path):
+        # one checkpoint in flight at a time, so unwritten arrays can't pile up
+        self._join_checkpoint()
+        # the profiler's wrappers live on the instances and can't be pickled
+        if self.profiler is not None:
+            self.profiler.detach(self.experiment)
+        try:
+            self._checkpoint_writer = checkpoint.save(self.experiment, path)
+        finally:
+            if self.profiler is not None:
+                self.profiler.attach(self.experiment)
+
+    def _join_checkpoint(self):
+        if self._checkpoint_writer is not None:
+            self._checkpoint_writer.join()
+            self._checkpoint_writer = None
+
+    # continue from a checkpoint. The experiment and simulation objects are kept and take
+    # the saved state, so anything holding on to them, like visuals, follows along.
+    # reseed=True gives a fork that diverges from the checkpoint rather than repeating it
+    def restore(self, path, reseed=False):
+        self._join_checkpoint()
+        if reseed:
+            self.seed = new_seed()
+        saved = checkpoint.load(path, seed=self.seed if reseed else None)
+        self.submit(self._restore, saved).result()
+
+    def _restore(self, saved):
+        if self.profiler is not None:
+            self.profiler.detach(self.experiment)
+        simulation = self.experiment.simulation
+        simulation.stop_recording()
+        _replace_vars(simulation, vars(saved.simulation))
+        _replace_vars(self.experiment, dict(vars(saved), simulation=simulation))
+        if self.profiler is not None:
+            self.profiler.attach(self.experiment)
+        self._publish_snapshot(force=True)
+        if self._mode == "visual":
+            self._gui_reset_trigger = True
+
+    # run as fast as possible for a number of steps, until until(experiment) is true, or
+    # until turned off again by calling turbo() with neither. The gui gets a progress frame
+    # every progress seconds. Returns whether turbo is now on
+    def turbo(self, steps=None, until=None, progress=1.0):
+        if self._mode not in ["visual", "safe"]:
+            print("turbo is only for visual and safe mode, optimal is already unthrottled")
+            return False
+        if steps is None and until is None and self._turbo:
+            self._turbo = False
+            return False
+        self._turbo_left = steps
+        self._turbo_until = until
+        self._turbo_progress = progress
+        self._turbo_next = time.perf_counter() + progress
+        self._turbo_frame = False
+        self._turbo = True
+        return True
+
+    def _turbo_step(self):
+        if self._turbo_left is not None:
+            self._turbo_left -= 1
+        done = self._turbo_left == 0 or (
+            self._turbo_until is not None and self._turbo_until(self.experiment)
+        )
+        if done:
+            self._turbo = False
+            self._pacer.reset()
+        elif time.perf_counter() < self._turbo_next:
+            return
+        self._turbo_next = time.perf_counter() + self._turbo_progress
+        self._publish_snapshot(force=True)
+        self._turbo_frame = True
 
     def reset(self, reseed=False):
         if reseed:
-            self.seed = np.random.randint(2**32)
+            self.seed = new_seed()
+        self._turbo = False
         # Causes continuation of outer loop of _run_timed
         self._is_reset = True
 
-    def speed(self, speed):
-        self._speed = 1/speed
+    # set the target steps per second, or with no argument return (achieved, target).
+    # achieved is None until a step has been paced
+    def speed(self, speed=None):
+        if speed is None:
+            return self._pacer.achieved(), self._pacer.target
+        self._pacer.set_rate(speed)
+
+    # run k iterations for every lock acquisition, gui handshake and snapshot. Speed is
+    # still in steps per second, a frame just advances k of them
+    def steps_per_sync(self, k):
+        self._steps_per_sync = max(int(k), 1)
 
+    # ask the gui for a frame and wait for its go ahead, running queued commands meanwhile. A paused gui stops its
+    # timer and doesn't hand over, so a checkpoint or safe_set would otherwise wait for it
+    def _wait_expturn(self):
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        handover = self._sync_expturn
+        sets = handover.sets
+        self._sync_guiturn.set()
+        while not handover.wait(sets, self._has_commands):
+            self._run_commands()
+        if profiler is not None:
+            profiler.add("sync wait", time.perf_counter() - start)
+
+    def _has_commands(self):
+        return bool(self._commands)
+
+    # takes effect at the next iteration boundary, change state through submit() to be
+    # sure it happens in between iterations
     def pause(self):
-        if not self._paused:
-            self._paused = True
-            self._pause_condition.acquire()
-        else:
-            self._paused = False
-            self._pause_condition.notify()
-            self._pause_condition.release()
+        with self._pause_condition:
+            self._paused = not self._paused
+            self._pause_condition.notify_all()
         return self._paused
 
+    def _wait_unpaused(self):
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        with self._pause_condition:
+            while self._paused:
+                if self._commands:
+                    # outside the condition, a command may pause or submit itself
+                    self._pause_condition.release()
+                    try:
+                        self._run_commands()
+                    finally:
+                        self._pause_condition.acquire()
+                else:
+                    self._pause_condition.wait()
+        if profiler is not None:
+            profiler.add("pause wait", time.perf_counter() - start)
+        self._pacer.reset()
+
+    # run func(*args, **kwargs) on the experiment thread in between iterations, also while
+    # paused. Returns a Future for the result. Runs straight away in optimal mode, when the
+    # experiment isn't running yet, or when called from the experiment thread itself
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        if self._mode not in ["visual", "safe"] or self._loop_ident in (None, get_ident()):
+            self._run_command(future, func, args, kwargs)
+            return future
+        self._commands.append((future, func, args, kwargs))
+        if self._paused:
+            with self._pause_condition:
+                self._pause_condition.notify_all()
+        if self._mode == "visual":
+            # the experiment may be waiting on the gui, which doesn't hand over while paused
+            self._sync_expturn.wake()
+        return future
+
+    # everything queued so far, in order
+    def _run_commands(self):
+        while self._commands:
+            self._run_command(*self._commands.popleft())
+
+    def _run_command(self, future, func, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+
     def run(self):
         assert self.experiment is not None
+        if self._mode == "visual" and self._gui_process:
+            # fork before the cli and experiment threads exist
+            self.gui.start()
         if self._mode != "optimal":
             self.interface_thread = Thread(target=self.interface._run, name="cli", daemon=True)
             self.interface_thread.start()
@@ -1,6 +1,16 @@
+from .rng import generator
+from .tracking import TrackedHistory, changed
+
+
 class Entity:
-    def __init__(self):
+    # without an rng the entity is given one spawned from its simulation's seed once it is
+    # part of the simulation, see Simulation.seed_entities. One that draws in __init__
+    # should be passed rng=simulation.spawn_rng() instead
+    def __init__(self, rng=None):
         self.tracked_variables = {}
+        changed()
+        self._default_rng = rng is None
+        self.rng = rng if rng is not None else generator()
 
     def initialize(self):              
         raise NotImplementedError
@@ -8,12 +18,15 @@ class Entity:
     # generally should not be called directly
     def update_track_hist(self, i):
         for var, hist in self.tracked_variables.items():
-            hist[0].append(i)
-            hist[1].append(vars(self)[var])
+            hist.record(i, vars(self)[var])
 
-    def track_variable(self, var):
-        self.tracked_variables[var] = [[],[]]
-        self.update_track_hist(0) # HACK
+    # capacity keeps only the most recent samples, in a fixed size ring
+    # stride, on_change and reduce set the sampling policy, see TrackedHistory
+    def track_variable(self, var, capacity=None, stride=1, on_change=False, reduce=None):
+        hist = TrackedHistory(capacity, stride=stride, on_change=on_change, reduce=reduce)
+        self.tracked_variables[var] = hist
+        hist.record(0, vars(self)[var]) # HACK
 
     def untrack_variable(self, var):
         del self.tracked_variables[var]
+        changed()
@@ -1,7 +1,18 @@
+from .rng import generator, seed_sequence
+
+
 class Experiment:
     def __init__(self, simulation = None, trial_length = -1):
         self.simulation = simulation
         self.trial_length = trial_length
+        self.seed_rng()
+
+    # one child of the seed for the experiment's own rng, one for the simulation
+    def seed_rng(self, seed=None):
+        own, child = seed_sequence(seed).spawn(2)
+        self.rng = generator(own)
+        if self.simulation is not None:
+            self.simulation.seed_rng(child)
     
     def _iterate(self):
         self.iterate()
@@ -9,14 +20,19 @@ class Experiment:
 
     def _initialize(self):
         self.initialize()
+        if self.simulation is not None:
+            self.simulation.seed_entities()
     
+    def snapshot(self):
+        return self.simulation.snapshot()
+
     # if overridden and called directly, consider implementing elements from _iterate
     def iterate(self):
         self.simulation.iterate()
 
     def run(self):
         for _ in range(self.trial_length):
-            self.iterate()
+            self._iterate()
 
     def initialize(self):
         self.simulation.__init__()
@@ -1,12 +1,15 @@
 # seems to be some problems with swapping in MF and inserting from cli
 import sys
 import threading
+import time
 
 import PyQt5.QtWidgets as pqtw
 import PyQt5.QtCore as pqtc
 from PyQt5.QtGui import QSurfaceFormat
 import numpy as np
 
+from .visuals import SharedCanvas
+
 STYLESHEET = """             QFrame{background-color: black; color: white}
                             \\\\VispyFrame{background-color: #110626}
                             VispyFrame{background-color: #24000E}
@@ -40,7 +43,7 @@ class GUIWindow(pqtw.QMainWindow):
     pause_signal = pqtc.pyqtSignal()
     fps_signal = pqtc.pyqtSignal(int)
     reset_signal = pqtc.pyqtSignal(bool)
-    add_tab_signal = pqtc.pyqtSignal(str, bool, str)
+    add_tab_signal = pqtc.pyqtSignal(str, bool, str, bool)
     insert_visual_signal = pqtc.pyqtSignal(int, int, int, object, object, object)
     add_slave_signal = pqtc.pyqtSignal(object)
     swap_visual_signal = pqtc.pyqtSignal(int, int, int, int)
@@ -87,6 +90,14 @@ class GUIWindow(pqtw.QMainWindow):
             window.close()
         super().closeEvent(event)
 
+def _on_screen(window):
+    if not window.isVisible() or window.isMinimized():
+        return False
+    # not exposed when fully covered, on platforms that report it
+    handle = window.windowHandle()
+    return handle is None or handle.isExposed()
+
+
 class MainFrame(pqtw.QFrame):
     def __init__(self, parent, core, fps):
         super().__init__(parent)
@@ -104,9 +115,13 @@ class MainFrame(pqtw.QFrame):
 
         self.tabs = []
         self.slave_windows = []
+        self._last_snapshot = None
+        # matplotlib's flush_events can fire the timer again from inside a frame
+        self._updating = False
 
         self.timer.timeout.connect(self.update)
         self.timer.start()
+        parent.installEventFilter(self)
 
     def add_slave(self, name):
         window = pqtw.QMainWindow()
@@ -115,34 +130,99 @@ class MainFrame(pqtw.QFrame):
         window.frame = SlaveFrame(window, self)
         window.setWindowTitle(name)
         window.setCentralWidget(window.frame)
+        window.installEventFilter(self)
         
-    def add_tab(self, name, buttons, layout):
-        new_tab = VisualTab(self, self, buttons, layout)
+    def add_tab(self, name, buttons, layout, shared=False):
+        new_tab = VisualTab(self, self, buttons, layout, shared)
         self.tabs.append(new_tab)
         self.qtab.addTab(new_tab, name)
 
     def tab_changed(self, tab):
-        for frame in self.tabs[tab].frames:
-            if len(frame.visuals) > 0 and frame.visuals[frame.index].frontend == "matplotlib":
-                frame.visuals[frame.index].update_triggered()
+        self.catch_up(self.tabs[tab].frames)
+
+    # a single update for frames that were hidden and are shown again. They can't wait for
+    # the frame loop, which doesn't run while paused, or in snapshot mode until the next
+    # snapshot arrives
+    def catch_up(self, frames):
+        snapshot = None
+        if self.core._snapshots and not self.core.framesync:
+            snapshot = self.core.snapshot
+            if snapshot is None:
+                return
+        updating, self._updating = self._updating, True
+        try:
+            for frame in frames:
+                frame.catch_up(snapshot)
+        finally:
+            self._updating = updating
+
+    # windows shown or restored from minimized catch up on what they show
+    def eventFilter(self, window, event):
+        if event.type() in (pqtc.QEvent.Show, pqtc.QEvent.WindowStateChange) and not window.isMinimized():
+            if window is self.window():
+                if self.tabs:
+                    self.tab_changed(self.qtab.currentIndex())
+            else:
+                self.catch_up(window.frame.shown_frames())
+        return False
 
     def update(self):
-        def loop_updates():
-            for tab in self.tabs:
-                tab.update()
-            for slave in self.slave_windows:
-                slave.frame.update()
+        profiler = self.core.profiler
+
+        # only what is on screen is drawn, plus visuals that ask for always_update.
+        # the rest catch up on the first frame they are shown again
+        def loop_updates(snapshot=None):
+            if profiler is not None:
+                profiler.tick("frame")
+            self._updating = True
+            try:
+                shown = _on_screen(self.window())
+                current = self.qtab.currentIndex()
+                for i, tab in enumerate(self.tabs):
+                    tab.update(snapshot, profiler, shown and i == current)
+                for slave in self.slave_windows:
+                    slave.frame.update(snapshot, profiler, _on_screen(slave))
+            finally:
+                self._updating = False
+
+        if self._updating:
+            return
                 
         if self.core._gui_reset_trigger:
+            self.core._gui_reset_trigger = False
+            # reset against the new state, not the snapshot of the visuals' last frame
+            snapshot = None
+            if self.core._snapshots and not self.core.framesync:
+                snapshot = self.core.snapshot
             for tab in self.tabs:
-                tab.reset()
+                tab.reset(snapshot)
             for slave in self.slave_windows:
-                slave.frame.reset()
-            self.core._gui_reset_trigger = False
+                slave.frame.reset(snapshot)
+
+        # skip frames while in turbo, other than the occasional progress frame
+        if self.core._turbo:
+            if not self.core._turbo_frame:
+                # a framesynced experiment may have been left waiting on the last frame
+                self.core._sync_expturn.set()
+                return
+            self.core._turbo_frame = False
+
+        # render whatever the experiment last published, never waiting on it
+        if self.core._snapshots and not self.core.framesync:
+            snapshot = self.core.snapshot
+            self.core._snapshot_wanted = True
+            if snapshot is not None and snapshot is not self._last_snapshot:
+                self._last_snapshot = snapshot
+                loop_updates(snapshot)
+            return
 
         self.core._sync_expturn.clear()
         self.timer.stop()
+        if profiler is not None:
+            waited = time.perf_counter()
         self.core._sync_guiturn.wait()
+        if profiler is not None:
+            profiler.add("gui wait", time.perf_counter() - waited)
         self.core._sync_guiturn.clear()
         self.timer.start()
         loop_updates()
@@ -158,6 +238,9 @@ class MainFrame(pqtw.QFrame):
     def reset(self, reseed=False):
         self.core.reset(reseed=reseed)
 
+    def turbo(self):
+        self.core.turbo()
+
 
 class SlaveFrame(pqtw.QFrame):
     def __init__(self, parent_window, mf):
@@ -172,18 +255,23 @@ class SlaveFrame(pqtw.QFrame):
         self.visual = None
         self.tabs = []
 
-    def add_tab(self, name, buttons = False, layout = "square"):
+    def add_tab(self, name, buttons = False, layout = "square", shared = False):
         if self.visual is not None:
             self.visual.setParent(None)
             self.visual = None
-        new_tab = VisualTab(self, self.mf, buttons, layout)
+        new_tab = VisualTab(self, self.mf, buttons, layout, shared)
         self.tabs.append(new_tab)
         self.qtab.addTab(new_tab, name)
 
     def tab_changed(self, tab):
-        for frame in self.tabs[tab].frames:
-            if len(frame.visuals) > 0 and frame.visuals[frame.index].frontend == "matplotlib":
-                frame.visuals[frame.index].update_triggered()
+        self.mf.catch_up(self.tabs[tab].frames)
+
+    def shown_frames(self):
+        if self.visual is not None:
+            return [self.visual]
+        if not self.tabs:
+            return []
+        return self.tabs[self.qtab.currentIndex()].frames
 
     def new_visual_frame(self, class_, *args, **kwargs):
         if self.qtab is not None:
@@ -199,27 +287,34 @@ class SlaveFrame(pqtw.QFrame):
     def swap_visual(self, index):
         self.visual.swap_visual(index)
     
-    def update(self):
+    def update(self, snapshot=None, profiler=None, visible=True):
         if self.visual is not None:
-            self.visual.update()
+            self.visual.update(snapshot, profiler, visible)
         else:
-            for tab in self.tabs:
-                tab.update()
+            current = self.qtab.currentIndex()
+            for i, tab in enumerate(self.tabs):
+                tab.update(snapshot, profiler, visible and i == current)
 
-    def reset(self):
+    def reset(self, snapshot=None):
         if self.visual is not None:
-            self.visual.reset() 
+            self.visual.reset(snapshot)
         else:
             for tab in self.tabs:
-                tab.reset()
+                tab.reset(snapshot)
 
+# shared puts every frame in a cell of one vispy canvas rather than a canvas each, for
+# dense dashboards of vispy visuals. matplotlib visuals need a tab of their own then
 class VisualTab(pqtw.QWidget):
-    def __init__(self, parent, mf, buttons, layout):
+    def __init__(self, parent, mf, buttons, layout, shared=False):
         super().__init__(parent)
         self.mf = mf
         self.buttons = buttons
         self.frames = []
+        self.shared = None
         self.init_ui()
+        if shared:
+            self.shared = SharedCanvas(self)
+            self.g_layout.addWidget(self.shared.canvas.native, 0, 0, 1, 1)
         if layout is not None:
             self.layout_frames(layout)
 
@@ -240,27 +335,38 @@ class VisualTab(pqtw.QWidget):
         pause_button = pqtw.QPushButton("Pause", self)
         reset_button = pqtw.QPushButton("Reset", self)
         reseed_button = pqtw.QPushButton("Reseed and Reset", self)
+        turbo_button = pqtw.QPushButton("Turbo", self)
 
         button_layout.addWidget(pause_button, 0, 1, 1, 1)
         button_layout.addWidget(reset_button, 0, 2, 1, 1)
         button_layout.addWidget(reseed_button, 0, 0, 1, 1)
+        button_layout.addWidget(turbo_button, 0, 3, 1, 1)
 
         pause_button.clicked.connect(lambda: self.mf.pause())
         reset_button.clicked.connect(lambda: self.mf.reset())
         reseed_button.clicked.connect(lambda: self.mf.reset(reseed=True))
-        self.button_pos = 3
+        turbo_button.clicked.connect(lambda: self.mf.turbo())
+        self.button_pos = 4
         return button_layout
 
-    def update(self):
+    def update(self, snapshot=None, profiler=None, visible=True):
         for frame in self.frames:
-            frame.update()
+            frame.update(snapshot, profiler, visible)
 
-    def reset(self):
+    def reset(self, snapshot=None):
         for frame in self.frames:
-            frame.reset()
+            frame.reset(snapshot)
 
     def new_visual_frame(self, class_, *args, **kwargs):
         pos = kwargs.pop("pos", (0, 0, 1, 1))
+        if self.shared is not None:
+            # the frame only keeps track of its visuals, they draw into its cell
+            new_visual_frame = VisualFrame(
+                self, class_, *args, shared=self.shared, cell=self.shared.cell(pos), **kwargs
+            )
+            new_visual_frame.hide()
+            self.frames.append(new_visual_frame)
+            return
         new_visual_frame = VisualFrame(self, class_, *args, **kwargs)
         self.frames.append(new_visual_frame)
         self.g_layout.addWidget(new_visual_frame, *pos)
@@ -317,6 +423,9 @@ class VisualFrame(pqtw.QFrame):
     def __init__(self, parent, class_, *args, **kwargs):
         super(VisualFrame, self).__init__(parent)
         self.box = pqtw.QHBoxLayout(self)
+        # set in shared tabs, see VisualTab
+        self.shared = kwargs.pop("shared", None)
+        self.cell = kwargs.pop("cell", None)
      
         self.index = 0
         self.visuals = []
@@ -328,25 +437,55 @@ class VisualFrame(pqtw.QFrame):
     def insert_visual(self, class_, *args, **kwargs):
         self.visuals.append(class_(self, *args, **kwargs))
         if len(self.visuals) > 1:
-            self.box.itemAt(self.index).widget().hide()
+            self.show_visual(self.index, False)
         self.index = len(self.visuals) - 1
         self.add_widget()
         # self.adjustSize()
 
     def swap_visual(self, index):
-        self.box.itemAt(self.index).widget().hide()
+        self.show_visual(self.index, False)
         self.index = index
-        self.box.itemAt(self.index).widget().show()
+        self.show_visual(self.index, True)
 
-    def update(self):
+    def show_visual(self, index, visible):
+        if self.shared is not None:
+            self.visuals[index].root.visible = visible
+        else:
+            self.box.itemAt(index).widget().setVisible(visible)
+
+    def update(self, snapshot=None, profiler=None, visible=True):
         if self.visuals:
-            self.visuals[self.index].iterate()
+            visual = self.visuals[self.index]
+            if not visible and not getattr(visual, "always_update", False):
+                return
+            visual.snapshot = snapshot
+            if profiler is None:
+                visual.iterate()
+            else:
+                start = time.perf_counter()
+                visual.iterate()
+                name = "visual {}@{:x}".format(type(visual).__name__, id(visual))
+                profiler.add(name, time.perf_counter() - start)
 
-    def reset(self):
+    def reset(self, snapshot=None):
         if self.visuals:
+            self.visuals[self.index].snapshot = snapshot
             self.visuals[self.index].reset()
 
+    def catch_up(self, snapshot=None):
+        if self.visuals:
+            visual = self.visuals[self.index]
+            visual.snapshot = snapshot
+            if visual.frontend == "matplotlib":
+                visual.update_triggered()
+            else:
+                visual.iterate()
+
     def add_widget(self):
+        if self.shared is not None:
+            if self.visuals[self.index].frontend != "vispy":
+                raise NameError("Shared tabs only hold vispy visuals")
+            return
         if self.visuals[self.index].frontend == "vispy":
             self.box.addWidget(self.visuals[self.index].canvas.native)
         elif self.visuals[self.index].frontend == "matplotlib":
@@ -383,14 +522,14 @@ class GUI:
         else:
             self._window.mf.tabs[tab].new_visual_frame(class_, *args, **kwargs)
 
-    def add_tab(self, name = "tab", buttons = True, layout = None):
+    def add_tab(self, name = "tab", buttons = True, layout = None, shared = False):
         if threading.current_thread().name == "cli":
             if layout is None:
                 print("Must assign a standard layout from CLI")
             else:
-                self._window.add_tab_signal.emit(name, buttons, layout)
+                self._window.add_tab_signal.emit(name, buttons, layout, shared)
         else:        
-            self._window.mf.add_tab(name, buttons, layout)
+            self._window.mf.add_tab(name, buttons, layout, shared)
 
     def add_slave(self, name = "Slave Window"):
         if threading.current_thread().name == "cli":
@@ -6,15 +6,35 @@ class CLI:
     def __init__(self, core):
         self.core = core
     
-    # set var in between experiment iterations, should make behaviour more predictable
+    # set var in between experiment iterations, should make behaviour more predictable.
+    # queued for the experiment thread, returns a Future, e.g. i.safe_set(...).result()
     def safe_set(self, target, var, val):
-        with self.core._iteration_lock:
-            vars(target)[var] = val
+        return self.core.submit(vars(target).__setitem__, var, val)
     
-    # call function in between experiment iterations, should make behaviour more predictable
+    # call function in between experiment iterations, should make behaviour more predictable.
+    # returns a Future for whatever func returns
     def safe(self, func):
-        with self.core._iteration_lock:
-            func()
+        return self.core.submit(func)
+
+    # fast forward, e.g. i.turbo(100000) or i.turbo(until=lambda e: e.simulation.i > 5000)
+    def turbo(self, steps=None, until=None, progress=1.0):
+        return self.core.turbo(steps, until, progress)
+
+    # save the full experiment state, e.g. i.checkpoint("checkpoints/before_change")
+    def checkpoint(self, path):
+        return self.core.checkpoint(path)
+
+    # continue from a checkpoint, reseed=True to fork off a different run from it
+    def restore(self, path, reseed=False):
+        self.core.restore(path, reseed)
+
+    # hot path timings, needs Core(..., profile=True) or core.profile()
+    def stats(self):
+        if self.core.profiler is None:
+            print("profiling is off, turn it on with c.profile()")
+            return None
+        print(self.core.profiler.report())
+        return self.core.profiler.stats()
 
     def _run(self):
         i = self
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class _Indices:
+    def __init__(self, size=64):
+        self._buf = np.empty(size, dtype=np.int64)
+        self.n = 0
+
+    def extend(self, values):
+        end = self.n + len(values)
+        if end > len(self._buf):
+            buf = np.empty(max(2 * len(self._buf), end), dtype=np.int64)
+            buf[:self.n] = self._buf[:self.n]
+            self._buf = buf
+        self._buf[self.n:end] = values
+        self.n = end
+
+    @property
+    def view(self):
+        return self._buf[:self.n]
+
+
+# Multi-resolution min/max summary of a growing series. Level k holds, for every complete
+# block of branching**k samples, the indices of its minimum and maximum, so any x range
+# can be drawn with about two points per pixel while keeping the peaks of the raw data.
+# update() only looks at samples added since the last call
+class MinMaxPyramid:
+    def __init__(self, branching=4):
+        self.branching = branching
+        self.clear()
+
+    def clear(self):
+        self._min = []
+        self._max = []
+        self._n = 0
+        self._first = None
+
+    def update(self, x, y):
+        # a ring history that wrapped has shifted every index, start again
+        if len(x) < self._n or (self._n and x[0] != self._first):
+            self.clear()
+        if len(x) == 0:
+            return
+        self._first = x[0]
+        self._n = len(x)
+        b = self.branching
+        level = 0
+        below = None
+        while True:
+            complete = self._n // b ** (level + 1)
+            if complete == 0:
+                break
+            if level == len(self._min):
+                self._min.append(_Indices())
+                self._max.append(_Indices())
+            done = self._min[level].n
+            if complete > done:
+                if below is None:
+                    start = done * b
+                    block = y[start:complete * b].reshape(-1, b)
+                    offset = start + np.arange(complete - done) * b
+                    mins = offset + block.argmin(axis=1)
+                    maxs = offset + block.argmax(axis=1)
+                else:
+                    lo = below[0].view[done * b:complete * b].reshape(-1, b)
+                    hi = below[1].view[done * b:complete * b].reshape(-1, b)
+                    rows = np.arange(len(lo))
+                    mins = lo[rows, y[lo].argmin(axis=1)]
+                    maxs = hi[rows, y[hi].argmax(axis=1)]
+                self._min[level].extend(mins)
+                self._max[level].extend(maxs)
+            below = (self._min[level], self._max[level])
+            level += 1
+
+    # indices of the samples to draw between raw indices i0 and i1
+    def _select(self, level, i0, i1, out):
+        if i0 >= i1:
+            return
+        if level == 0:
+            out.append(np.arange(i0, i1))
+            return
+        size = self.branching ** level
+        j0 = -(-i0 // size)
+        j1 = min(i1 // size, self._min[level - 1].n)
+        if j0 >= j1:
+            self._select(level - 1, i0, i1, out)
+            return
+        self._select(level - 1, i0, j0 * size, out)
+        lo = self._min[level - 1].view[j0:j1]
+        hi = self._max[level - 1].view[j0:j1]
+        pairs = np.empty((j1 - j0, 2), dtype=np.int64)
+        pairs[:, 0] = np.minimum(lo, hi)
+        pairs[:, 1] = np.maximum(lo, hi)
+        out.append(pairs.ravel())
+        self._select(level - 1, j1 * size, i1, out)
+
+    # the decimated series between x0 and x1 for a plot width of px pixels
+    def query(self, x, y, x0=None, x1=None, px=1000):
+        i0 = 0 if x0 is None else max(np.searchsorted(x, x0, side="left") - 1, 0)
+        i1 = len(x) if x1 is None else min(np.searchsorted(x, x1, side="right") + 1, len(x))
+        count = i1 - i0
+        level = 0
+        while level < len(self._min) and count / self.branching ** level > px:
+            level += 1
+        out = []
+        self._select(level, i0, i1, out)
+        if not out:
+            return x[:0], y[:0]
+        index = np.concatenate(out)
+        return x[index], y[index]
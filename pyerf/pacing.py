@@ -0,0 +1,71 @@
+import time
+
+POLICIES = ["skip", "catchup"]
+
+
+# Paces a loop at rate steps per second against absolute perf_counter_ns deadlines, so
+# sleep overshoot doesn't add up and wall clock adjustments don't matter. wait() sleeps
+# until shortly before the deadline and spins the rest, sleep alone is too coarse at
+# the default 1000 steps per second.
+#
+# When the loop falls behind, "skip" drops the missed deadlines and paces on from now,
+# "catchup" runs unpaced until the lost steps are made up, at most max_lag seconds worth.
+# Being late by less than a period is made up either way, it's only sleep overshoot
+class Pacer:
+    def __init__(self, rate, policy="skip", max_lag=1.0, spin=200e-6, window=1.0):
+        if policy not in POLICIES:
+            raise NameError("Valid pacing policies: {0}".format(POLICIES))
+        self.policy = policy
+        self.max_lag_ns = int(max_lag * 1e9)
+        self.spin_ns = int(spin * 1e9)
+        self.window_ns = int(window * 1e9)
+        self.set_rate(rate)
+        self.reset()
+
+    def set_rate(self, rate):
+        self.target = rate
+        self.period_ns = int(1e9 / rate)
+
+    # start pacing from now, e.g. after a pause
+    def reset(self):
+        now = time.perf_counter_ns()
+        self._deadline = now
+        self._window = (0, now)
+        self._steps = 0
+        self._achieved = None
+        self.late = 0
+
+    def wait(self, steps=1):
+        self._steps += steps
+        self._deadline += steps * self.period_ns
+        now = time.perf_counter_ns()
+        remaining = self._deadline - now
+        if remaining > 0:
+            if remaining > self.spin_ns:
+                time.sleep((remaining - self.spin_ns) / 1e9)
+            while time.perf_counter_ns() < self._deadline:
+                pass
+        else:
+            self.late += 1
+            behind = -remaining
+            if behind > self.max_lag_ns or self.policy == "skip" and behind > steps * self.period_ns:
+                self._deadline = now
+        self._measure()
+
+    def _measure(self):
+        count, then = self._window
+        now = time.perf_counter_ns()
+        if now - then >= self.window_ns:
+            self._achieved = (self._steps - count) * 1e9 / (now - then)
+            self._window = (self._steps, now)
+
+    # steps per second over the last window, or so far until a window has passed. None
+    # before the first step
+    def achieved(self):
+        if self._achieved is not None:
+            return self._achieved
+        count, then = self._window
+        elapsed = time.perf_counter_ns() - then
+        if self._steps == count or elapsed <= 0:
+            return None
+        return (self._steps - count) * 1e9 / elapsed
@@ -0,0 +1,56 @@
+import numpy as np
+
+from .entity import Entity
+
+
+# View of one agent in a Population, so per agent code can keep using robot.pos.
+# Column attributes read and write the agent's row of the population's arrays
+class Agent:
+    def __init__(self, population, index):
+        object.__setattr__(self, "population", population)
+        object.__setattr__(self, "index", index)
+
+    def __getattr__(self, name):
+        if name in self.population._columns:
+            return vars(self.population)[name][self.index]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name in self.population._columns:
+            vars(self.population)[name][self.index] = value
+        else:
+            object.__setattr__(self, name, value)
+
+
+# Entity for n agents stored struct-of-arrays, each column an attribute with a leading
+# agent axis. initialize, iterate and tracking act on whole columns, so a tracked column
+# costs one append per step for the whole population
+class Population(Entity):
+    def __init__(self, n, rng=None, **columns):
+        super().__init__(rng)
+        self.n = n
+        self._columns = []
+        for name, row in columns.items():
+            self.add_column(name, row)
+
+    # row is the value for a single agent, broadcast to all n
+    def add_column(self, name, row, dtype=None):
+        row = np.asarray(row, dtype=dtype)
+        vars(self)[name] = np.broadcast_to(row, (self.n,) + row.shape).copy()
+        if name not in self._columns:
+            self._columns.append(name)
+
+    def iterate(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if not -self.n <= index < self.n:
+            raise IndexError(index)
+        return Agent(self, index % self.n)
+
+    def __iter__(self):
+        for index in range(self.n):
+            yield Agent(self, index)
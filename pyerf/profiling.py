@@ -0,0 +1,88 @@
+from collections import defaultdict
+from time import perf_counter
+
+
+# Timing counters for the hot paths. Core only creates one when profiling is on, and
+# every hook is behind an `is not None` check, so a disabled profiler costs nothing more.
+#
+# add() accumulates a duration under a name, tick() counts events whose rate is wanted
+class Profiler:
+    def __init__(self, window=1.0):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.maxima = defaultdict(float)
+        self.ticks = defaultdict(int)
+        self._rates = {}
+        # every rate's first window starts here
+        self._start = perf_counter()
+        self._since = {}
+
+    def add(self, name, duration):
+        self.totals[name] += duration
+        self.counts[name] += 1
+        if duration > self.maxima[name]:
+            self.maxima[name] = duration
+
+    def tick(self, name):
+        self.ticks[name] += 1
+
+    # events per second, averaged over at least the last window seconds, or since reset()
+    # while the first window is still running
+    def rate(self, name):
+        now = perf_counter()
+        count, then = self._since.get(name, (0, self._start))
+        if now - then >= self.window:
+            self._rates[name] = (self.ticks[name] - count) / (now - then)
+            self._since[name] = (self.ticks[name], now)
+        elif name not in self._rates:
+            return (self.ticks[name] - count) / (now - then) if now > then else 0.0
+        return self._rates[name]
+
+    def timed(self, name, func):
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            result = func(*args, **kwargs)
+            self.add(name, perf_counter() - start)
+            return result
+        timed.profiled = True
+        return timed
+
+    # time iterate and bookkeeping separately by shadowing them on the instances
+    def attach(self, experiment):
+        self.detach(experiment)
+        experiment.iterate = self.timed("iterate", experiment.iterate)
+        simulation = experiment.simulation
+        simulation._iterate_bookkeeping = self.timed("bookkeeping", simulation._iterate_bookkeeping)
+
+    def detach(self, experiment):
+        for obj, name in ((experiment, "iterate"), (experiment.simulation, "_iterate_bookkeeping")):
+            if getattr(vars(obj).get(name), "profiled", False):
+                del vars(obj)[name]
+
+    # {name: {"mean", "max", "total", "count"}} plus "steps/s" and "fps"
+    def stats(self):
+        stats = {
+            name: {
+                "mean": self.totals[name] / self.counts[name],
+                "max": self.maxima[name],
+                "total": self.totals[name],
+                "count": self.counts[name],
+            }
+            for name in self.counts
+        }
+        stats["steps/s"] = self.rate("step")
+        stats["fps"] = self.rate("frame")
+        return stats
+
+    def report(self):
+        stats = self.stats()
+        lines = ["steps/s {:10.1f}    fps {:6.1f}".format(stats.pop("steps/s"), stats.pop("fps"))]
+        for name, s in sorted(stats.items()):
+            lines.append("{:<28} mean {:9.3f} ms  max {:9.3f} ms  n {}".format(
+                name, 1000 * s["mean"], 1000 * s["max"], s["count"]
+            ))
+        return "\n".join(lines)
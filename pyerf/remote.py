@@ -0,0 +1,376 @@
+import json
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .simulation import Snapshot
+from .tracking import TrackedHistory
+
+# calls that only set the gui up, recorded until the gui process starts
+_SETUP = ["add_tab", "add_slave", "insert_visual", "add_visual_frame", "swap_visual", "fps"]
+
+
+def _shared(shape, dtype):
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+# Latest samples of a tracked history, in shared memory: steps holds the number of
+# samples written so far and then `capacity` steps, values the matching values
+class _Ring:
+    def __init__(self, capacity, dtype, shape):
+        self.steps_shm, self.steps = _shared((capacity + 1,), np.int64)
+        self.values_shm, self.values = _shared((capacity,) + shape, dtype)
+        self.steps[0] = 0
+        # the history last published and how many of its samples were
+        self.hist = None
+        self.published = 0
+
+    def entry(self, name):
+        values = self.values
+        return [name, self.steps_shm.name, self.values_shm.name, values.dtype.str, list(values.shape[1:])]
+
+    def free(self):
+        for shm in (self.steps_shm, self.values_shm):
+            shm.close()
+            shm.unlink()
+
+
+# Latest samples of every tracked history, as rings of `history` samples, plus the current
+# value of some state variables, in shared memory. The experiment writes and the gui
+# process reads, neither waits on the other. A sequence number that is odd while a write
+# is in progress lets the reader retry a torn read (a seqlock).
+#
+# Rings are allocated on a history's first sample, with its dtype and shape, and again
+# whenever those change. The writer lists them by name in a shared directory, and the
+# reader attaches to them by name whenever the directory changes, so histories tracked
+# after the gui process has forked are sent too
+class SharedState:
+    def __init__(self, simulation, state=(), history=100000, directory=1 << 20):
+        self.capacity = history
+        self._segments = []
+        self.state = []
+        for name in state:
+            source, var = simulation.resolve(name)
+            value = np.asarray(vars(source)[var])
+            if value.dtype.kind not in "biufc":
+                raise TypeError("{} is not numeric and cannot be shared".format(name))
+            self.state.append((name, self._array(value.shape, value.dtype)))
+        # seq, i, reset generation, directory generation, directory length
+        self.header = self._array((5,), np.int64)
+        self.header[:] = 0
+        # json list of [name, steps segment, values segment, dtype, shape]
+        self._directory = self._array((directory,), np.uint8)
+        # writer side, {name: _Ring} and names that can't be sent
+        self._rings = {}
+        self._skipped = set()
+        # reader side, the directory generation attached to and {name: (steps, values)}
+        self._layout = 0
+        self._attached = {}
+        self._attached_shm = {}
+
+    def _array(self, shape, dtype):
+        shm, array = _shared(shape, dtype)
+        self._segments.append(shm)
+        return array
+
+    def write(self, simulation, reset=False):
+        header = self.header
+        header[0] += 1
+        if reset:
+            header[2] += 1
+        header[1] = simulation.i
+        histories = simulation.tracked_histories()
+        layout = False
+        for name in [name for name in self._rings if name not in histories]:
+            self._rings.pop(name).free()
+            layout = True
+        for name, hist in histories.items():
+            n = len(hist)
+            if n == 0 or name in self._skipped:
+                continue
+            ring = self._rings.get(name)
+            dtype, shape = hist._values.dtype, hist._values.shape[1:]
+            if ring is None or ring.values.dtype != dtype or ring.values.shape[1:] != shape:
+                if dtype.kind not in "biufc":
+                    print("{} is not numeric and is not sent to the gui process".format(name))
+                    self._skipped.add(name)
+                    continue
+                if ring is not None:
+                    ring.free()
+                ring = self._rings[name] = _Ring(self.capacity, dtype, shape)
+                layout = True
+            count = ring.steps[0]
+            if ring.hist is not hist or n < ring.published:
+                # re-tracked or cleared, start the ring over
+                ring.published = count = 0
+            new = min(n - ring.published, self.capacity)
+            if new > 0:
+                steps, values = hist.tail(new)
+                self._put(ring.steps[1:], steps, count)
+                self._put(ring.values, values, count)
+                count += new
+            ring.steps[0] = count
+            ring.hist = hist
+            ring.published = n
+        if layout:
+            self._write_directory()
+        for (name, array) in self.state:
+            source, var = simulation.resolve(name)
+            array[...] = vars(source)[var]
+        header[0] += 1
+
+    def _write_directory(self):
+        data = json.dumps([ring.entry(name) for name, ring in self._rings.items()]).encode()
+        while len(data) > len(self._directory):
+            # too many histories to list, the last ones are dropped
+            name, ring = self._rings.popitem()
+            print("{} does not fit the gui process's directory and is not sent".format(name))
+            self._skipped.add(name)
+            ring.free()
+            data = json.dumps([ring.entry(name) for name, ring in self._rings.items()]).encode()
+        self._directory[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self.header[4] = len(data)
+        self.header[3] += 1
+
+    def _put(self, ring, data, count):
+        k = count % self.capacity
+        first = min(len(data), self.capacity - k)
+        ring[k:k + first] = data[:first]
+        ring[:len(data) - first] = data[first:]
+
+    def _get(self, ring, count):
+        if count <= self.capacity:
+            return ring[:count].copy()
+        k = count % self.capacity
+        return np.concatenate((ring[k:], ring[:k]))
+
+    # reader side, rings no longer listed are let go of
+    def _attach(self, length):
+        entries = json.loads(bytes(self._directory[:length]).decode())
+        attached, attached_shm = {}, {}
+        for name, steps_name, values_name, dtype, shape in entries:
+            key = (steps_name, values_name)
+            if self._attached_shm.get(name, (None,))[0] == key:
+                attached[name] = self._attached[name]
+                attached_shm[name] = self._attached_shm.pop(name)
+                continue
+            steps_shm = shared_memory.SharedMemory(name=steps_name)
+            values_shm = shared_memory.SharedMemory(name=values_name)
+            attached_shm[name] = (key, steps_shm, values_shm)
+            attached[name] = (
+                np.ndarray((self.capacity + 1,), dtype=np.int64, buffer=steps_shm.buf),
+                np.ndarray((self.capacity,) + tuple(shape), dtype=np.dtype(dtype), buffer=values_shm.buf),
+            )
+        self._close_attached()
+        self._attached, self._attached_shm = attached, attached_shm
+
+    def _close_attached(self):
+        self._attached = {}
+        for _, steps_shm, values_shm in self._attached_shm.values():
+            steps_shm.close()
+            values_shm.close()
+        self._attached_shm = {}
+
+    def _read(self, seq):
+        header = self.header.copy()
+        if header[3] != self._layout:
+            self._attach(int(header[4]))
+            self._layout = header[3]
+        tracked = {}
+        for name, (steps, values) in self._attached.items():
+            count = int(steps[0])
+            tracked[name] = (self._get(steps[1:], count), self._get(values, count))
+        state = {name: array.copy() for name, array in self.state}
+        if int(self.header[0]) != seq:
+            return None
+        return seq, int(header[1]), int(header[2]), tracked, state
+
+    # (seq, i, reset generation, {name: (steps, values)}, {name: value}), retried with a
+    # growing back off while the experiment is writing. None when every try was torn, a
+    # skipped frame is only a glitch on screen
+    def read(self, tries=10):
+        delay = 0
+        for _ in range(tries):
+            seq = int(self.header[0])
+            if seq % 2 == 0:
+                try:
+                    frame = self._read(seq)
+                except (FileNotFoundError, ValueError):
+                    # a ring was freed, or the directory rewritten, while attaching
+                    self._layout = 0
+                    frame = None
+                if frame is not None:
+                    return frame
+            time.sleep(delay)
+            delay = min(2 * delay or 50e-6, 5e-3)
+        return None
+
+    def close(self, unlink=False):
+        self._close_attached()
+        for ring in self._rings.values() if unlink else ():
+            ring.free()
+        for shm in self._segments:
+            shm.close()
+            if unlink:
+                shm.unlink()
+
+
+# Stands in for the Core inside the gui process. The gui only renders published
+# snapshots, and its buttons are sent back to the experiment process
+class _ChildCore:
+    def __init__(self, core, shared, conn):
+        self.title = core.title
+        self.experiment = core.experiment
+        self.profiler = None
+        self.framesync = False
+        self._snapshots = True
+        self._turbo = False
+        self._turbo_frame = False
+        self._shared = shared
+        self._conn = conn
+        self._paused = False
+        self._seq = None
+        self._snapshot = None
+        self._reset_seen = 0
+
+    # the snapshot is rebuilt only when the experiment has published since the last one.
+    # it is also applied to this process's copy of the simulation, for visuals that read
+    # the simulation directly
+    @property
+    def snapshot(self):
+        if int(self._shared.header[0]) == self._seq:
+            return self._snapshot
+        frame = self._shared.read()
+        if frame is None:
+            return self._snapshot
+        seq, i, _, tracked, state = frame
+        simulation = self.experiment.simulation
+        simulation.i = i
+        for name, (steps, values) in tracked.items():
+            try:
+                source, var = simulation.resolve(name)
+            except KeyError:
+                # an entity added after the fork, this copy of the simulation has no such source
+                continue
+            source.tracked_variables[var] = TrackedHistory.wrap(steps, values)
+        for name, value in state.items():
+            source, var = simulation.resolve(name)
+            vars(source)[var] = value
+        self._seq = seq
+        self._snapshot = Snapshot(i, tracked, state, simulation.tracked_sources())
+        return self._snapshot
+
+    @property
+    def _gui_reset_trigger(self):
+        return int(self._shared.header[2]) != self._reset_seen
+
+    @_gui_reset_trigger.setter
+    def _gui_reset_trigger(self, value):
+        if not value:
+            self._reset_seen = int(self._shared.header[2])
+
+    def pause(self):
+        self._paused = not self._paused
+        self._conn.send(("pause", (), {}))
+        return self._paused
+
+    def reset(self, reseed=False):
+        self._conn.send(("reset", (), {"reseed": reseed}))
+
+    def turbo(self):
+        self._conn.send(("turbo", (), {}))
+
+
+def _child_main(core, shared, conn, calls, fps):
+    from .gui import GUI
+
+    child = _ChildCore(core, shared, conn)
+    gui = GUI(child, fps)
+    for name, args, kwargs in calls:
+        getattr(gui, name)(*args, **kwargs)
+
+    # calls made while running come in on a thread named like the cli's, so the gui
+    # routes them through its signals just as it does for the cli
+    def listen():
+        while True:
+            name, args, kwargs = conn.recv()
+            getattr(gui, name)(*args, **kwargs)
+
+    threading.Thread(target=listen, name="cli", daemon=True).start()
+    gui.show_windows()
+    gui._begin()
+    conn.send(("closed", (), {}))
+
+
+# The Core's gui when running with gui_process=True. Setup calls are recorded and
+# replayed in a forked gui process, later calls are forwarded to it. The experiment
+# publishes into SharedState and the gui process renders whatever was published last,
+# so rendering load doesn't hold the GIL of the experiment's process.
+#
+# Visuals in the gui process see their own copy of the simulation, kept up to date with
+# the last `history` samples of every tracked variable and with the state names given
+class RemoteGUI:
+    def __init__(self, core, fps, state=(), history=100000):
+        self.core = core
+        self._fps = fps
+        self._state = state
+        self._history = history
+        self._calls = []
+        self._conn = None
+        self.shared = None
+        self._next = 0
+
+    def __getattr__(self, name):
+        if name not in _SETUP + ["pause", "reset", "quit", "trigger_update"]:
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            if self._conn is None:
+                self._calls.append((name, args, kwargs))
+            else:
+                self._conn.send((name, args, kwargs))
+        return call
+
+    # fork the gui process, before any other thread is started
+    def start(self):
+        self.shared = SharedState(self.core.experiment.simulation, self._state, self._history)
+        self.shared.write(self.core.experiment.simulation, reset=True)
+        self._conn, conn = multiprocessing.Pipe()
+        context = multiprocessing.get_context("fork")
+        self.process = context.Process(
+            target=_child_main, args=(self.core, self.shared, conn, self._calls, self._fps), daemon=True
+        )
+        self.process.start()
+
+    # at most twice per frame, the frame after a reset is always sent
+    def publish(self):
+        core = self.core
+        reset = core._gui_reset_trigger
+        now = time.perf_counter()
+        if self.shared is None or (now < self._next and not reset):
+            return
+        self._next = now + self._fps / 2000
+        core._gui_reset_trigger = False
+        self.shared.write(core.experiment.simulation, reset)
+
+    def show_windows(self):
+        pass
+
+    # serves the gui process's buttons until its windows are closed
+    def _begin(self):
+        try:
+            while True:
+                name, args, kwargs = self._conn.recv()
+                if name == "closed":
+                    break
+                getattr(self.core, name)(*args, **kwargs)
+        except EOFError:
+            pass
+        finally:
+            self.process.join(1)
+            self.shared.close(unlink=True)
@@ -0,0 +1,91 @@
+import os
+import subprocess
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import imsave
+
+
+# Renders a visual against an experiment without any windows, as fast as the experiment
+# and the drawing allow. Every `every` steps a frame is grabbed, from an offscreen vispy
+# canvas or an Agg figure, and piped to ffmpeg. With encoder=None the frames are written
+# as numbered pngs into the output directory instead.
+#
+# vispy still needs a GL backend, on a machine with no display use e.g. backend="egl"
+class Renderer:
+    def __init__(self, experiment, class_, *args, every=1, fps=30, output="render.mp4",
+                 encoder="ffmpeg", seed=None, backend=None, size=None, **kwargs):
+        if backend is not None:
+            from vispy import app
+            app.use_app(backend)
+        self.experiment = experiment
+        if seed is not None:
+            experiment.seed_rng(seed)
+            experiment._initialize()
+        if class_.frontend == "matplotlib":
+            # same visual, drawn into an Agg canvas so Qt is never involved
+            class_ = type(class_.__name__, (class_,), {"canvas_class": FigureCanvasAgg})
+        self.visual = class_(None, *args, **kwargs)
+        if size is not None and self.visual.frontend == "vispy":
+            self.visual.canvas.size = size
+        self.every = every
+        self.fps = fps
+        self.output = output
+        self.encoder = encoder
+        self.frames = 0
+        self._pipe = None
+
+    def frame(self):
+        if self.visual.frontend == "vispy":
+            self.visual.iterate()
+            return self.visual.canvas.render()
+        # a single render: update_triggered redraws the figure, or blits onto it with
+        # fast=True. The canvas only draws itself if the visual never has
+        self.visual.update_triggered()
+        canvas = self.visual.canvas
+        if getattr(canvas, "renderer", None) is None:
+            canvas.draw()
+        return np.asarray(canvas.buffer_rgba())
+
+    def write(self, image):
+        if self.encoder is None:
+            os.makedirs(self.output, exist_ok=True)
+            imsave(os.path.join(self.output, "{:06d}.png".format(self.frames)), image)
+        else:
+            if self._pipe is None:
+                self._open(image.shape[1], image.shape[0])
+            self._pipe.stdin.write(np.ascontiguousarray(image).tobytes())
+        self.frames += 1
+
+    def _open(self, width, height):
+        self._pipe = subprocess.Popen(
+            [
+                self.encoder, "-y", "-loglevel", "error",
+                "-f", "rawvideo", "-pix_fmt", "rgba",
+                "-s", "{}x{}".format(width, height), "-r", str(self.fps),
+                "-i", "-",
+                # yuv420p needs even dimensions
+                "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-pix_fmt", "yuv420p", self.output,
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def close(self):
+        if self._pipe is not None:
+            self._pipe.stdin.close()
+            self._pipe.wait()
+            self._pipe = None
+
+    def run(self, steps=None):
+        if steps is None:
+            steps = self.experiment.trial_length
+        try:
+            self.write(self.frame())
+            for step in range(1, steps + 1):
+                self.experiment._iterate()
+                if step % self.every == 0:
+                    self.write(self.frame())
+        finally:
+            self.close()
+        return self.frames
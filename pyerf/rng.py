@@ -0,0 +1,17 @@
+import numpy as np
+
+
+def seed_sequence(seed=None):
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def generator(seed=None):
+    return np.random.Generator(np.random.PCG64(seed_sequence(seed)))
+
+
+# fresh 32 bit seed from os entropy, leaves the global numpy rng alone
+def new_seed():
+    return int(np.random.SeedSequence().generate_state(1)[0])
+
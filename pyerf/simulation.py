@@ -1,10 +1,65 @@
+import os
+
+from . import tracking
+from .entity import Entity
+from .rng import generator, seed_sequence
+from .trace import TraceWriter
+from .tracking import TrackedHistory, changed
+
+
+# Immutable view of a simulation after an iteration, published for the gui to render.
+# tracked maps each tracked history's name, like "robots.0.pos", to (steps, values).
+# sources is the (name, source) pairs it was taken from, so visuals holding on to a
+# source can find its name without looking at the live simulation, which a reset may
+# be rebuilding with new entities
+class Snapshot:
+    def __init__(self, i, tracked, state, sources=()):
+        self.i = i
+        self.tracked = tracked
+        self.state = state
+        self.sources = list(sources)
+        self._names = {id(source): name for name, source in self.sources}
+
+    # (steps, values) of source's var, None when source isn't part of this snapshot
+    def series(self, source, var):
+        name = self._names.get(id(source))
+        if name is None:
+            return None
+        return self.tracked.get("{}.{}".format(name, var))
+
+
 class Simulation:
     def __init__(self, environment = None, tracking = False):
         self.tracked_variables = {}
+        self._gather = None
+        changed()
         self.environment = environment
         self.robots = []
+        # array backed entities, see Population
+        self.populations = []
         self.i = 0
         self.tracking = tracking
+        # keep an injected rng and any recording across the re-init that initialize() usually does
+        if not hasattr(self, "rng"):
+            self.seed_rng()
+        if not hasattr(self, "_trace"):
+            self._trace = None
+
+    def seed_rng(self, seed=None):
+        self._seed_seq = seed_sequence(seed)
+        self.rng = generator(self._seed_seq)
+        self.seed_entities()
+
+    # entities created without an rng get one spawned from the seed, so Core(seed=...)
+    # reproduces them. Run again by Experiment._initialize for the entities it creates
+    def seed_entities(self):
+        for _, source in self.tracked_sources():
+            if getattr(source, "_default_rng", False):
+                source.rng = self.spawn_rng()
+
+    # independent rng for an entity, e.g. Robot(rng=self.spawn_rng())
+    def spawn_rng(self):
+        return generator(self._seed_seq.spawn(1)[0])
 
     # This should be overridden for more complex sims
     def initialize(self):
@@ -16,25 +71,119 @@ class Simulation:
             self.environment.initialize()
         for robot in self.robots:
             robot.initialize()
+        for population in self.populations:
+            population.initialize()
 
+    # This should be overridden, by default only populations are iterated
+    def iterate(self):
+        for population in self.populations:
+            population.iterate()
+
+    # every tracked variable is recorded by one compiled function, rebuilt only when the
+    # tracked variables or the entities change. lists compare their items by identity first
     def update_track_hist(self, i):
+        gather = self._gather
+        if (gather is None or gather.generation != tracking.generation
+                or gather.environment is not self.environment
+                or gather.robots != self.robots or gather.populations != self.populations):
+            gather = self._gather = self._compile_gather()
+        gather(i)
+
+    # straight line code for update_track_hist, e.g. for a robot tracking pos:
+    #     r0(i, d0['pos'])
+    # with d0 the robot's __dict__ and r0 its history's record. Entities overriding
+    # update_track_hist are called instead
+    def _compile_gather(self):
+        sources = [self.environment] if self.environment is not None else []
+        sources += self.robots + self.populations
+        names = {}
+        lines = ["def gather(i):"]
+        for j, source in enumerate(sources + [self]):
+            if source is not self and type(source).update_track_hist is not Entity.update_track_hist:
+                names["s{}".format(j)] = source
+                lines.append("    s{}.update_track_hist(i)".format(j))
+                continue
+            names["d{}".format(j)] = vars(source)
+            for k, (var, hist) in enumerate(source.tracked_variables.items()):
+                names["r{}_{}".format(j, k)] = hist.record
+                lines.append("    r{}_{}(i, d{}[{!r}])".format(j, k, j, var))
+        lines.append("    pass")
+        exec("\n".join(lines), names)
+        gather = names["gather"]
+        gather.generation = tracking.generation
+        gather.environment = self.environment
+        gather.robots = list(self.robots)
+        gather.populations = list(self.populations)
+        return gather
+
+    # named owners of tracked variables, so histories can be addressed outside the process
+    def tracked_sources(self):
+        sources = [("simulation", self)]
         if self.environment is not None:
-            self.environment.update_track_hist(i)
-        for robot in self.robots:
-            robot.update_track_hist(i)
-        for var, hist in self.tracked_variables.items():
-            hist[0].append(i)
-            hist[1].append(vars(self)[var])
+            sources.append(("environment", self.environment))
+        for j, robot in enumerate(self.robots):
+            sources.append(("robots.{}".format(j), robot))
+        for j, population in enumerate(self.populations):
+            sources.append(("populations.{}".format(j), population))
+        return sources
+
+    def tracked_histories(self):
+        return {
+            "{}.{}".format(name, var): hist
+            for name, source in self.tracked_sources()
+            for var, hist in source.tracked_variables.items()
+        }
+
+    # keep only the latest chunk of every tracked history in memory and write the rest to
+    # files under path, named after the history like "robots.0.pos.0.steps.bin". Call
+    # again after re-tracking
+    def spill_histories(self, path, chunk=1 << 16):
+        for name, hist in self.tracked_histories().items():
+            hist.spill_to(os.path.join(path, name), chunk)
+
+    # (source, attribute) for a name such as "robots.0.pos"
+    def resolve(self, name):
+        source, var = name.rsplit(".", 1)
+        return dict(self.tracked_sources())[source], var
+
+    # write every tracked variable, and any extra state names, to a trace each step
+    def record(self, path, state=(), chunk=1024, compress=False):
+        self.stop_recording()
+        self._trace = TraceWriter(self, path, state, chunk, compress)
+
+    def stop_recording(self):
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    # a recording belongs to the run that started it, a restored copy doesn't continue it
+    def __getstate__(self):
+        state = dict(vars(self))
+        state["_trace"] = None
+        state["_gather"] = None
+        return state
+
+    def snapshot(self):
+        tracked = {name: hist.frozen() for name, hist in self.tracked_histories().items()}
+        return Snapshot(self.i, tracked, self.snapshot_state(), self.tracked_sources())
+
+    # override to publish extra state for visuals, values must not be mutated afterwards
+    def snapshot_state(self):
+        return {}
 
-    def track_variable(self, var):
-        v = vars(self)[var]
-        self.tracked_variables[v] = [[],[]]
+    def track_variable(self, var, capacity=None, stride=1, on_change=False, reduce=None):
+        self.tracked_variables[var] = TrackedHistory(
+            capacity, stride=stride, on_change=on_change, reduce=reduce
+        )
 
     def untrack_variable(self, var):
-        del self.tracked_variables[vars(self)[var]]
+        del self.tracked_variables[var]
+        changed()
 
     # iterate generic background stuff
     def _iterate_bookkeeping(self):
         if self.tracking:
             self.i += 1
             self.update_track_hist(self.i)
+        if self._trace is not None:
+            self._trace.write()
@@ -0,0 +1,194 @@
+import os
+from queue import Queue
+from threading import Lock, Thread
+
+import numpy as np
+
+# one writer thread for every spilling history, started on first use
+_queue = Queue()
+_writer = None
+# spills opened so far per path, every Spill gets files of its own, see Spill
+_serials = {}
+
+
+def _write_loop():
+    while True:
+        spill, s, steps, values = _queue.get()
+        try:
+            spill._write(s, steps, values)
+        finally:
+            _queue.task_done()
+
+
+# block until every chunk handed over so far is on disk
+def flush():
+    _queue.join()
+
+
+# On disk part of a TrackedHistory. Full chunks of samples are handed to the writer
+# thread, which appends them to <path>.<n>.steps.bin and to the values file of their
+# segment, <path>.<n>.values.<s>.bin. n counts the spills of a path in this process, so a
+# cleared or re-tracked history never shares files with chunks still queued for the old
+# one. A new segment is started whenever the dtype of the values changes, e.g. an int
+# variable that later holds floats, and reads cast the segments to a common dtype.
+#
+# Until a chunk is written it stays pending in memory, so reads always see every sample:
+# the written segments memory mapped, then the pending chunks, then the history's in
+# memory tail, see column()
+class Spill:
+    def __init__(self, path, chunk):
+        self.path = path
+        self.chunk = chunk
+        serial = _serials.get(path, 0)
+        _serials[path] = serial + 1
+        self.prefix = "{}.{}".format(path, serial)
+        self.pushed = 0
+        self.written = 0
+        self.pending = []
+        # [dtype, shape, samples written] per values segment
+        self.segments = []
+        self._lock = Lock()
+        self._maps = {}
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        open(self.prefix + ".steps.bin", "wb").close()
+
+    def push(self, steps, values):
+        global _writer
+        if not self.segments or self.segments[-1][:2] != [values.dtype, values.shape[1:]]:
+            with self._lock:
+                self.segments.append([values.dtype, values.shape[1:], 0])
+        s = len(self.segments) - 1
+        with self._lock:
+            self.pending.append((s, steps, values))
+        self.pushed += len(steps)
+        if _writer is None:
+            _writer = Thread(target=_write_loop, name="spill", daemon=True)
+            _writer.start()
+        _queue.put((self, s, steps, values))
+
+    def _values_path(self, s):
+        return "{}.values.{}.bin".format(self.prefix, s)
+
+    # writer thread only
+    def _write(self, s, steps, values):
+        with open(self.prefix + ".steps.bin", "ab") as f:
+            f.write(np.ascontiguousarray(steps).tobytes())
+        with open(self._values_path(s), "ab" if self.segments[s][2] else "wb") as f:
+            f.write(np.ascontiguousarray(values).tobytes())
+        with self._lock:
+            self.pending.pop(0)
+            self.written += len(steps)
+            self.segments[s][2] += len(steps)
+
+    def _mapped(self, key, filename, dtype, shape, count):
+        mapped = self._maps.get(key)
+        if mapped is None or len(mapped) != count:
+            mapped = np.memmap(filename, dtype=dtype, mode="r", shape=(count,) + shape)
+            self._maps[key] = mapped
+        return mapped
+
+    # the whole column as a Segmented view over the spilled and pending parts and the
+    # tail, nothing is copied. k is 0 for steps and 1 for values
+    def column(self, k, tail):
+        with self._lock:
+            written = self.written
+            segments = [list(segment) for segment in self.segments]
+            pending = [chunk[1 + k] for chunk in self.pending]
+        parts = []
+        if k == 0:
+            if written:
+                parts.append(self._mapped("steps", self.prefix + ".steps.bin", np.int64, (), written))
+        else:
+            for s, (dtype, shape, count) in enumerate(segments):
+                if count:
+                    parts.append(self._mapped(s, self._values_path(s), dtype, shape, count))
+        return Segmented(parts + pending + [tail])
+
+
+# Read only array made of several arrays back to back, e.g. a spilled history. Indexing
+# and slicing only copy what they select, cast to the dtype common to all parts, and
+# searchsorted() bisects the parts. np.asarray(column) copies all of it
+class Segmented:
+    def __init__(self, parts, dtype=None):
+        # empty parts are dropped, bar the last, which keeps the shape of a row
+        self.parts = [part for part in parts[:-1] if len(part)] + [parts[-1]]
+        self.dtype = np.dtype(dtype) if dtype is not None else np.result_type(*self.parts)
+        ends = np.cumsum([len(part) for part in self.parts])
+        self._starts = ends - [len(part) for part in self.parts]
+        self._ends = ends
+        self.shape = (int(ends[-1]),) + self.parts[-1].shape[1:]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self._range(0, len(self))
+        return data if dtype is None else data.astype(dtype)
+
+    def _range(self, start, stop):
+        pieces = []
+        for part, first in zip(self.parts, self._starts):
+            a, b = max(start - first, 0), min(stop - first, len(part))
+            if a < b or not pieces and part is self.parts[-1]:
+                pieces.append(part[a:max(a, b)])
+        if len(pieces) == 1:
+            return np.asarray(pieces[0], dtype=self.dtype)
+        return np.concatenate(pieces).astype(self.dtype, copy=False)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            first = self[key[0]]
+            if isinstance(key[0], (int, np.integer)):
+                return first[key[1:]]
+            return first[(slice(None),) * (first.ndim - self.ndim + 1) + key[1:]]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return self[np.arange(start, stop, step)]
+            return self._range(start, max(start, stop))
+        if isinstance(key, (int, np.integer)):
+            index = key + len(self) if key < 0 else key
+            if not 0 <= index < len(self):
+                raise IndexError("index {} is out of bounds for length {}".format(key, len(self)))
+            j = int(np.searchsorted(self._ends, index, side="right"))
+            return np.asarray(self.parts[j][index - self._starts[j]], dtype=self.dtype)[()]
+        index = np.asarray(key)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        flat = index.ravel()
+        flat = np.where(flat < 0, flat + len(self), flat)
+        if flat.size and (flat.min() < 0 or flat.max() >= len(self)):
+            raise IndexError("index out of bounds for length {}".format(len(self)))
+        out = np.empty((len(flat),) + self.shape[1:], dtype=self.dtype)
+        j = np.searchsorted(self._ends, flat, side="right")
+        for p in np.unique(j):
+            mask = j == p
+            out[mask] = self.parts[p][flat[mask] - self._starts[p]]
+        return out.reshape(index.shape + self.shape[1:])
+
+    # only the leading axis is kept, rows are reshaped part by part
+    def reshape(self, *shape):
+        if len(shape) == 1 and isinstance(shape[0], tuple):
+            shape = shape[0]
+        row = tuple(shape[1:])
+        if -1 in row:
+            known = int(np.prod([size for size in row if size != -1]))
+            size = int(np.prod(self.shape[1:]))
+            row = tuple(size // known if r == -1 else r for r in row)
+        return Segmented([part.reshape((len(part),) + row) for part in self.parts], self.dtype)
+
+    # for sorted columns like steps, np.searchsorted(column, v) ends up here
+    def searchsorted(self, v, side="left", sorter=None):
+        if np.ndim(v):
+            return np.array([self.searchsorted(x, side) for x in np.ravel(v)]).reshape(np.shape(v))
+        lasts = [part[-1] for part in self.parts if len(part)]
+        j = int(np.searchsorted(lasts, v, side=side))
+        if j == len(lasts):
+            return len(self)
+        return int(self._starts[j] + np.searchsorted(self.parts[j], v, side=side))
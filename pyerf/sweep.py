@@ -0,0 +1,69 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+import os
+
+from .core import Core
+from .rng import new_seed, seed_sequence
+
+
+class TrialResult:
+    def __init__(self, index, params, seed, histories):
+        self.index = index
+        self.params = params
+        self.seed = seed
+        # {"robots.0.pos": (steps, values)}, see Simulation.tracked_histories
+        self.histories = histories
+
+
+# each trial gets its own optimal mode Core, seeded before the experiment is initialized
+def _run_trial(factory, index, params, seed, trial_length):
+    experiment = factory(**params)
+    if trial_length is not None:
+        experiment.trial_length = trial_length
+    core = Core(experiment, mode="optimal", seed=seed)
+    core._initialize()
+    core.run()
+    histories = {
+        name: (hist.steps, hist.values)
+        for name, hist in experiment.simulation.tracked_histories().items()
+    }
+    return TrialResult(index, params, seed, histories)
+
+
+# Runs an experiment factory over every combination of a parameter grid and a list of
+# seeds, fanned out over a process pool. factory(**params) must return an Experiment,
+# and it and the grid values have to be picklable to reach the workers
+class Sweep:
+    def __init__(self, factory, grid=None, seeds=None, trials=1, seed=None, processes=None,
+                 trial_length=None):
+        self.factory = factory
+        self.grid = grid if grid is not None else {}
+        self.seed = seed if seed is not None else new_seed()
+        if seeds is None:
+            # spawned from the sweep seed, so a rerun gives the same trials whatever the scheduling
+            children = seed_sequence(self.seed).spawn(trials)
+            seeds = [int(child.generate_state(1)[0]) for child in children]
+        self.seeds = list(seeds)
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.trial_length = trial_length
+
+    def trials(self):
+        keys = list(self.grid)
+        for values in product(*(self.grid[key] for key in keys)):
+            params = dict(zip(keys, values))
+            for seed in self.seeds:
+                yield params, seed
+
+    # yields TrialResults as soon as each trial finishes
+    def run(self):
+        with ProcessPoolExecutor(self.processes) as pool:
+            futures = [
+                pool.submit(_run_trial, self.factory, index, params, seed, self.trial_length)
+                for index, (params, seed) in enumerate(self.trials())
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    # all results, in the order of trials()
+    def collect(self):
+        return sorted(self.run(), key=lambda result: result.index)
@@ -0,0 +1,179 @@
+import json
+import os
+
+import numpy as np
+
+from . import tracking
+from .experiment import Experiment
+from .tracking import TrackedHistory
+
+
+# Trace of a run, one row per step for every recorded variable. It is a directory with
+# meta.json, a steps column and one raw file per variable, appended a chunk at a time so
+# a Trace can memory map them. With compress=True each chunk is instead a compressed
+# .npz, smaller on disk but loaded a chunk at a time rather than mapped
+class TraceWriter:
+    def __init__(self, simulation, path, state=(), chunk=1024, compress=False):
+        self.path = path
+        self.chunk = chunk
+        self.compress = compress
+        # tracked variables are rebuilt as histories on replay, state is just set
+        self.fields = [(name, True) for name in simulation.tracked_histories()]
+        self.fields += [(name, False) for name in state]
+        self.simulation = simulation
+        self._resolve()
+        self._buffers = None
+        self._steps = np.empty(chunk, dtype=np.int64)
+        self._k = 0
+        self.steps = 0
+        self.chunks = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _allocate(self, values):
+        self._buffers = []
+        for (name, _), value in zip(self.fields, values):
+            value = np.asarray(value)
+            if value.dtype.kind not in "biufc":
+                raise TypeError("{} is not numeric and cannot be traced".format(name))
+            self._buffers.append(np.empty((self.chunk,) + value.shape, dtype=value.dtype))
+
+    # sources are looked up again whenever entities may have been replaced, e.g. by the
+    # re-init of a reset, so the trace follows the live ones
+    def _resolve(self):
+        self._targets = [self.simulation.resolve(name) for name, _ in self.fields]
+        self._generation = tracking.generation
+
+    def write(self):
+        if self._generation != tracking.generation:
+            self._resolve()
+        values = [vars(source)[var] for source, var in self._targets]
+        if self._buffers is None:
+            self._allocate(values)
+        k = self._k
+        self._steps[k] = self.steps
+        for buf, value in zip(self._buffers, values):
+            buf[k] = value
+        self._k += 1
+        self.steps += 1
+        if self._k == self.chunk:
+            self.flush()
+
+    def flush(self):
+        if self._k == 0:
+            return
+        k = self._k
+        if self.compress:
+            arrays = {name: buf[:k] for (name, _), buf in zip(self.fields, self._buffers)}
+            np.savez_compressed(
+                os.path.join(self.path, "{:06d}.npz".format(self.chunks)), steps=self._steps[:k], **arrays
+            )
+        else:
+            with open(os.path.join(self.path, "steps.bin"), "ab") as f:
+                f.write(self._steps[:k].tobytes())
+            for (name, _), buf in zip(self.fields, self._buffers):
+                with open(os.path.join(self.path, name + ".bin"), "ab") as f:
+                    f.write(np.ascontiguousarray(buf[:k]).tobytes())
+        self.chunks += 1
+        self._k = 0
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            "steps": self.steps,
+            "chunk": self.chunk,
+            "compress": self.compress,
+            "fields": [
+                {"name": name, "tracked": tracked, "dtype": buf.dtype.str, "shape": buf.shape[1:]}
+                for (name, tracked), buf in zip(self.fields, self._buffers or [])
+            ],
+        }
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    def close(self):
+        self.flush()
+        self._write_meta()
+
+
+# Read side of a trace. trace[name] is the whole column for a variable, memory mapped
+# unless the trace was compressed
+class Trace:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.length = meta["steps"]
+        self.chunk = meta["chunk"]
+        self.compress = meta["compress"]
+        self.fields = meta["fields"]
+        self._chunk_cache = (None, None)
+        self._columns = {}
+        if not self.compress:
+            self._columns["steps"] = self._map("steps", "<i8", [])
+            for field in self.fields:
+                self._columns[field["name"]] = self._map(field["name"], field["dtype"], field["shape"])
+
+    def _map(self, name, dtype, shape):
+        return np.memmap(
+            os.path.join(self.path, name + ".bin"), dtype=dtype, mode="r", shape=(self.length, *shape)
+        )
+
+    def _load_chunk(self, c):
+        if self._chunk_cache[0] != c:
+            with np.load(os.path.join(self.path, "{:06d}.npz".format(c))) as data:
+                self._chunk_cache = (c, dict(data))
+        return self._chunk_cache[1]
+
+    def __len__(self):
+        return self.length
+
+    # compressed columns are decompressed whole on first use and kept
+    def __getitem__(self, name):
+        if name not in self._columns:
+            chunks = -(-self.length // self.chunk)
+            self._columns[name] = np.concatenate([self._load_chunk(c)[name] for c in range(chunks)])
+        return self._columns[name]
+
+    # {name: value} at step k
+    def step(self, k):
+        if not self.compress:
+            return {field["name"]: self._columns[field["name"]][k] for field in self.fields}
+        data = self._load_chunk(k // self.chunk)
+        return {field["name"]: data[field["name"]][k % self.chunk] for field in self.fields}
+
+    # set the simulation to step k: state is assigned and tracked variables get read only
+    # histories over the trace up to k
+    def apply(self, simulation, k):
+        values = self.step(k)
+        for field in self.fields:
+            source, var = simulation.resolve(field["name"])
+            vars(source)[var] = values[field["name"]]
+            if field["tracked"]:
+                source.tracked_variables[var] = TrackedHistory.wrap(
+                    self["steps"][:k + 1], self[field["name"]][:k + 1]
+                )
+
+
+# Plays a trace back through a simulation of the same shape without running the model.
+# rate is steps per iteration and can be fractional or negative, seek() jumps anywhere
+class ReplayExperiment(Experiment):
+    def __init__(self, simulation, path, rate=1):
+        super().__init__(simulation, trial_length=-1)
+        self.trace = Trace(path)
+        self.trial_length = len(self.trace)
+        self.rate = rate
+        self.position = 0.0
+
+    def seek(self, step):
+        self.position = float(min(max(step, 0), len(self.trace) - 1))
+        self.trace.apply(self.simulation, int(self.position))
+
+    # no bookkeeping, the histories come straight from the trace
+    def _iterate(self):
+        self.iterate()
+
+    def iterate(self):
+        self.seek(self.position + self.rate)
+
+    def initialize(self):
+        self.seek(0)
@@ -0,0 +1,286 @@
+import numpy as np
+
+from .spill import Spill
+
+# bumped whenever a set of tracked variables may have changed, so compiled gathers know
+# to recompile, see Simulation.update_track_hist
+generation = 0
+
+
+def changed():
+    global generation
+    generation += 1
+
+
+REDUCTIONS = {
+    "min": np.minimum,
+    "max": np.maximum,
+    "mean": np.add,
+}
+
+
+# Columnar store for a tracked variable. Steps and values are kept in preallocated
+# numpy arrays which grow by doubling, or wrap around as a ring when given a capacity.
+# hist[0] and hist[1] give the steps and values in order, as views where possible
+#
+# record() applies the sampling policy: keep every stride-th step, only keep changed
+# values, and/or reduce each window of stride steps to its min, max or mean
+#
+# spill_to() bounds the memory of a growable history: only the latest chunk of samples
+# stays in memory, older ones are written out in the background, see spill.Spill
+class TrackedHistory:
+    def __init__(self, capacity=None, size=64, stride=1, on_change=False, reduce=None):
+        if reduce is not None and reduce not in REDUCTIONS:
+            raise NameError("Valid reductions: {0}".format(list(REDUCTIONS)))
+        self.capacity = capacity
+        self.stride = stride
+        self.on_change = on_change
+        self.reduce = reduce
+        self._acc = None
+        self._acc_n = 0
+        # skip the policy entirely when every sample is kept
+        if stride == 1 and not on_change and reduce is None:
+            self.record = self.append
+        self._initial_size = size
+        self._size = capacity if capacity is not None else size
+        self._steps = None
+        self._values = None
+        self._type = None
+        # (dtype, shape) of the last ndarray appended, ndarrays of one type can still differ
+        self._row = None
+        self._n = 0
+        # index of the oldest sample, only moves in ring mode
+        self._start = 0
+        self._spill = None
+        changed()
+
+    # read only history over existing arrays, e.g. memory mapped from a trace.
+    # the first append copies them into fresh buffers
+    @classmethod
+    def wrap(cls, steps, values):
+        hist = cls()
+        hist._steps = steps
+        hist._values = values
+        hist._size = hist._n = len(steps)
+        hist._type = None
+        hist._row = None
+        return hist
+
+    def _allocate(self, value):
+        value = np.asarray(value)
+        dtype = value.dtype if value.dtype.kind in "biufc" else np.dtype(object)
+        shape = value.shape if dtype != object else ()
+        self._steps = np.empty(self._size, dtype=np.int64)
+        self._values = np.empty((self._size,) + shape, dtype=dtype)
+
+    # slow path, only taken when the type of the tracked value changes, or the dtype or
+    # shape of a tracked ndarray
+    def _check_dtype(self, value):
+        self._type = type(value)
+        self._row = (value.dtype, value.shape) if isinstance(value, np.ndarray) else None
+        dtype = self._values.dtype
+        if dtype == object:
+            return
+        value = np.asarray(value)
+        if value.dtype.kind not in "biufc" or value.shape != self._values.shape[1:]:
+            # rows that don't fit the buffer are kept as one object per sample from now on
+            self._to_object()
+            return
+        new_dtype = np.result_type(dtype, value.dtype)
+        if new_dtype != dtype:
+            self._values = self._values.astype(new_dtype)
+
+    def _to_object(self):
+        if self._spill is not None:
+            self._unspill()
+        values = np.empty(len(self._values), dtype=object)
+        for k in range(len(values)):
+            values[k] = self._values[k]
+        self._values = values
+
+    # pulls the spilled samples back, only numeric values of one shape can be spilled
+    def _unspill(self):
+        print("{} no longer fits an array and is kept in memory".format(self._spill.path))
+        steps, values = np.asarray(self.steps), np.asarray(self.values)
+        self._spill = None
+        self._steps, self._values = steps, values
+        self._n = self._size = len(steps)
+
+    def spill_to(self, path, chunk=1 << 16):
+        if self.capacity is not None:
+            raise NameError("a ring history is already bounded and can't spill")
+        # spilling again starts over from a copy of everything so far
+        steps, values = np.asarray(self.steps), np.asarray(self.values)
+        if values.dtype == object:
+            raise TypeError("{} is not numeric and cannot be spilled".format(path))
+        self._spill = Spill(path, chunk)
+        self._size = chunk
+        if self._n:
+            self._spill.push(steps, values)
+            self._steps = np.empty(chunk, dtype=steps.dtype)
+            self._values = np.empty((chunk,) + values.shape[1:], dtype=values.dtype)
+            self._n = 0
+
+    def _grow(self):
+        if self._spill is not None and self._values.dtype == object:
+            self._unspill()
+        if self._spill is not None:
+            # hand the full buffers over rather than copying out of them
+            self._spill.push(self._steps, self._values)
+            self._steps = np.empty_like(self._steps)
+            self._values = np.empty_like(self._values)
+            self._n = 0
+            return
+        self._size = max(2 * self._size, 1)
+        steps = np.empty(self._size, dtype=self._steps.dtype)
+        steps[:self._n] = self._steps[:self._n]
+        values = np.empty((self._size,) + self._values.shape[1:], dtype=self._values.dtype)
+        values[:self._n] = self._values[:self._n]
+        self._steps = steps
+        self._values = values
+
+    def append(self, i, value):
+        if self._values is None:
+            self._allocate(value)
+        if type(value) is not self._type:
+            self._check_dtype(value)
+        elif self._row is not None and (value.dtype != self._row[0] or value.shape != self._row[1]):
+            self._check_dtype(value)
+        if self.capacity is None:
+            if self._n == self._size:
+                self._grow()
+            k = self._n
+            self._n += 1
+        else:
+            k = (self._start + self._n) % self.capacity
+            if self._n == self.capacity:
+                self._start = (self._start + 1) % self.capacity
+            else:
+                self._n += 1
+        self._steps[k] = i
+        self._values[k] = value
+
+    def record(self, i, value):
+        if self.reduce is not None:
+            self._accumulate(value)
+        if i % self.stride:
+            return
+        if self.reduce is not None:
+            value = self._acc / self._acc_n if self.reduce == "mean" else self._acc
+            self._acc = None
+        if self.on_change and self._n and np.array_equal(value, self._last()):
+            return
+        self.append(i, value)
+
+    def _accumulate(self, value):
+        if self._acc is None:
+            self._acc = np.array(value, dtype=float)
+            self._acc_n = 1
+        else:
+            self._acc = REDUCTIONS[self.reduce](self._acc, value)
+            self._acc_n += 1
+
+    def _last(self):
+        k = self._start + self._n - 1
+        if self.capacity is not None:
+            k %= self.capacity
+        return self._values[k]
+
+    # dropping the buffers rather than rewinding keeps earlier frozen() arrays intact
+    def clear(self):
+        self._steps = None
+        self._values = None
+        self._type = None
+        self._row = None
+        self._size = self.capacity if self.capacity is not None else self._initial_size
+        self._n = 0
+        self._start = 0
+        self._acc = None
+        if self._spill is not None:
+            self._spill = Spill(self._spill.path, self._spill.chunk)
+
+    # pickled as the frozen arrays, see checkpoint. record may be bound to append
+    def __getstate__(self):
+        state = dict(vars(self))
+        state.pop("record", None)
+        # spilled samples are pickled along with the rest, the copy doesn't spill
+        state["_spill"] = None
+        if self._steps is not None:
+            state["_steps"], state["_values"] = (np.asarray(column) for column in self.frozen())
+            state["_n"] = state["_size"] = len(self)
+            state["_start"] = 0
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("_spill", None)
+        if "_row" not in state:
+            # older checkpoints, check the next value whatever its type
+            state["_type"] = state["_row"] = None
+        vars(self).update(state)
+        changed()
+        if self.stride == 1 and not self.on_change and self.reduce is None:
+            self.record = self.append
+        if self.capacity is not None and self._steps is not None:
+            # a ring needs its full capacity back to wrap around in
+            steps, values = self._steps, self._values
+            self._size = self.capacity
+            self._steps = np.empty(self.capacity, dtype=steps.dtype)
+            self._values = np.empty((self.capacity,) + values.shape[1:], dtype=values.dtype)
+            self._steps[:self._n] = steps
+            self._values[:self._n] = values
+
+    # steps and values as they are now, unaffected by later appends. A spilled history
+    # gives Segmented views, the spilled part stays on disk
+    def frozen(self):
+        if self.capacity is None:
+            return self.steps, self.values
+        steps, values = self._ordered(self._steps), self._ordered(self._values)
+        if self._start == 0:
+            # not wrapped, these are views of buffers the ring keeps writing to
+            steps, values = steps.copy(), values.copy()
+        return steps, values
+
+    # steps and values of the last k samples, without putting a wrapped ring in order
+    def tail(self, k):
+        n = len(self)
+        k = min(k, n)
+        if self.capacity is None:
+            return self.steps[n - k:], self.values[n - k:]
+        index = np.arange(self._start + n - k, self._start + n) % self.capacity
+        return self._steps[index], self._values[index]
+
+    def _ordered(self, buf):
+        if buf is None:
+            return np.empty(0)
+        if self._start == 0:
+            return buf[:self._n]
+        # wrapped ring, has to be copied to come out in order
+        return np.concatenate((buf[self._start:], buf[:self._start]))
+
+    @property
+    def steps(self):
+        if self._spill is not None:
+            return self._spill.column(0, self._ordered(self._steps))
+        return self._ordered(self._steps)
+
+    @property
+    def values(self):
+        if self._spill is not None:
+            return self._spill.column(1, self._ordered(self._values))
+        return self._ordered(self._values)
+
+    def __getitem__(self, index):
+        if index == 0 or index == -2:
+            return self.steps
+        if index == 1 or index == -1:
+            return self.values
+        raise IndexError("tracked histories only hold steps [0] and values [1]")
+
+    def __iter__(self):
+        yield self.steps
+        yield self.values
+
+    def __len__(self):
+        if self._spill is not None:
+            return self._spill.pushed + self._n
+        return self._n
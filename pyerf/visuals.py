@@ -1,6 +1,8 @@
 from itertools import cycle
 
-from vispy import scene
+from vispy import scene, gloo
+from vispy.color import Color
+from vispy.visuals import Visual
 
 from matplotlib.figure import Figure
 from matplotlib.animation import Animation
@@ -9,6 +11,8 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 
 import numpy as np
 
+from .lod import MinMaxPyramid
+
 COLORS = [
     "#fc5a50",
     "#7bc8f6",
@@ -19,18 +23,178 @@ COLORS = [
     "#c5c9c7",
 ]
 
+# x and y data of a tracked variable given as (getter, source, var[, index]),
+# read from the published snapshot when the gui is running in snapshot mode. That is
+# (None, None) while a reset swaps the entities, until the next snapshot has them
+def _series(lam, snapshot=None):
+    source = lam[0](lam[1])
+    if snapshot is not None:
+        series = snapshot.series(source, lam[2])
+        if series is None:
+            return None, None
+        x, y = series
+    else:
+        x, y = source.tracked_variables[lam[2]]
+    if len(lam) == 4:
+        y = y.reshape(len(y), -1)[:, lam[3]]
+    return x, y
+
+# Line strip kept in a vertex buffer with spare capacity, so each frame only uploads the
+# samples appended since the last one. With a window only the latest samples are drawn;
+# the buffer holds twice that, so the window only occasionally slides back to the start.
+# Lines on the same canvas can share a buffer, see SharedCanvas
+class LineBuffer:
+    def __init__(self, capacity=1024, window=None):
+        self.window = window
+        self.capacity = 2 * window if window is not None else capacity
+        self.host = np.zeros((self.capacity, 2), dtype=np.float32)
+        self.vbo = gloo.VertexBuffer(self.host)
+        self.clear()
+
+    @property
+    def data(self):
+        return self.host[self.start:self.end]
+
+    def append(self, x, y):
+        new = np.empty((len(x), 2), dtype=np.float32)
+        new[:, 0] = x
+        new[:, 1] = y
+        if self.window is not None:
+            new = new[-self.window:]
+        n = len(new)
+        if self.end + n > self.capacity:
+            if self.window is not None:
+                keep = min(self.window - n, self.end - self.start)
+                self.host[:keep] = self.host[self.end - keep:self.end]
+                self.start, self.end = 0, keep
+            else:
+                self.capacity = max(2 * self.capacity, self.end + n)
+                host = np.zeros((self.capacity, 2), dtype=np.float32)
+                host[:self.end] = self.host[:self.end]
+                self.host = host
+            self.host[self.end:self.end + n] = new
+            self.vbo.set_data(self.host)
+        else:
+            self.host[self.end:self.end + n] = new
+            self.vbo.set_subdata(new, offset=self.end)
+        self.end += n
+        if self.window is not None:
+            self.start = max(self.start, self.end - self.window)
+        # step of the last sample, lines sharing the buffer skip anything up to it
+        self.last_step = x[-1]
+        self.maxx = max(self.maxx, x[-1])
+        self.miny = min(self.miny, y.min())
+        self.maxy = max(self.maxy, y.max())
+
+    def clear(self):
+        self.start = 0
+        self.end = 0
+        self.last_step = -np.inf
+        self.maxx = -np.inf
+        self.miny = np.inf
+        self.maxy = -np.inf
+
+
+class AppendLineVisual(Visual):
+    VERTEX = """
+        void main(void) {
+            gl_Position = $transform(vec4($position, 0.0, 1.0));
+        }
+    """
+    FRAGMENT = """
+        void main() {
+            gl_FragColor = $color;
+        }
+    """
+
+    def __init__(self, color="w", capacity=1024, window=None, buffer=None):
+        Visual.__init__(self, vcode=self.VERTEX, fcode=self.FRAGMENT)
+        self.buffer = buffer if buffer is not None else LineBuffer(capacity, window)
+        self.window = self.buffer.window
+        self._draw_mode = "line_strip"
+        self.set_gl_state("translucent")
+        self.shared_program.frag["color"] = Color(color).rgba
+
+    @property
+    def data(self):
+        return self.buffer.data
+
+    @property
+    def last_step(self):
+        return self.buffer.last_step
+
+    def append(self, x, y):
+        self.buffer.append(x, y)
+        self.update()
+
+    def clear(self):
+        self.buffer.clear()
+        self.update()
+
+    def _prepare_transforms(self, view):
+        view.view_program.vert["transform"] = view.get_transform()
+
+    # the range is picked up here, as another line may have appended to a shared buffer
+    def _prepare_draw(self, view):
+        buffer = self.buffer
+        if buffer.end - buffer.start < 2:
+            return False
+        self.shared_program.vert["position"] = buffer.vbo[buffer.start:buffer.end]
+        return True
+
+    def _compute_bounds(self, axis, view):
+        if axis > 1 or self.buffer.end == self.buffer.start:
+            return None
+        data = self.data[:, axis]
+        return data.min(), data.max()
+
+AppendLine = scene.visuals.create_visual_node(AppendLineVisual)
+
+# One canvas for every vispy visual in a tab, each frame getting a cell of its grid.
+# A single GL context draws and swaps once per frame, and incremental lines showing the
+# same variable upload it once into a shared LineBuffer
+class SharedCanvas:
+    def __init__(self, parent):
+        self.canvas = scene.SceneCanvas(keys="interactive", parent=parent, show=True, bgcolor="#24000E")
+        self.grid = self.canvas.central_widget.add_grid()
+        self.line_buffers = {}
+
+    # pos is (row, col, row_span, col_span), as for the tab layouts
+    def cell(self, pos):
+        row, col, row_span, col_span = pos
+        return self.grid.add_grid(row=row, col=col, row_span=row_span, col_span=col_span)
+
+    def line_buffer(self, key, window=None):
+        if key not in self.line_buffers:
+            self.line_buffers[key] = LineBuffer(window=window)
+        return self.line_buffers[key]
+
+
 # Base class for general model visualizations
 class BaseVispy:
     frontend = "vispy"
+    # keep updating while the visual's tab or window is hidden
+    always_update = False
 
     def __init__(self, widget, axes=False, range_ = None, interactive=True, aspect = None, **kwargs):
-        self.canvas = scene.SceneCanvas(
-            keys="interactive", parent=widget, show=True, bgcolor="#24000E"
-        )
+        # latest simulation Snapshot, set by the gui before iterate() in snapshot mode
+        self.snapshot = None
+        # in a shared tab the visual only gets a cell of the tab's canvas, stacked with
+        # any other visuals of its frame and hidden when swapped out
+        self.shared = getattr(widget, "shared", None)
+        if self.shared is not None:
+            self.canvas = self.shared.canvas
+            self.root = widget.cell.add_grid(row=0, col=0)
+        else:
+            # no widget means an offscreen canvas, see render.Renderer
+            self.canvas = scene.SceneCanvas(
+                keys="interactive", parent=widget, show=widget is not None, bgcolor="#24000E"
+            )
+            self.root = self.canvas.central_widget
         if axes:
             self.init_axes(**kwargs)
         else:
-            self.view = self.canvas.central_widget.add_view()
+            self.view = self.root.add_view()
             self.view.camera = "panzoom"
 
         if aspect is not None:
@@ -46,7 +210,7 @@ class BaseVispy:
         pass
 
     def init_axes(self, **kwargs):
-        self.grid = self.canvas.central_widget.add_grid(margin=10)
+        self.grid = self.root.add_grid(margin=10)
         self.grid.spacing = 0
         self.r = 0
 
@@ -91,11 +255,19 @@ class BaseVispy:
         raise NotImplementedError
         
     
+# incremental only uploads new samples each frame, window also limits the plot to the
+# latest samples. lod plots a min/max decimation of about two points per pixel instead
+# of the full history, redone only when there is new data or the view moves
 class BaseVispyTS(BaseVispy):
-    def __init__(self, widget, vars_ = [], **kwargs):
+    def __init__(self, widget, vars_ = [], incremental=False, window=None, lod=False, **kwargs):
         super().__init__(widget, axes = True, **kwargs)
+        self.incremental = incremental or window is not None
+        self.window = window
+        self.lod = lod
         self._tracked_vars = []
         self.lines = []
+        self._pyramids = []
+        self._lod_keys = []
         for var in vars_:
             self.add_var(var)
         self.minx = 0
@@ -105,23 +277,42 @@ class BaseVispyTS(BaseVispy):
 
     def add_var(self, var):
         self._tracked_vars.append(var)
+        color = COLORS[len(self.lines)%len(COLORS)]
+        if self.incremental:
+            buffer = None
+            if self.shared is not None:
+                # same entity, variable, column and window means the same data
+                key = (id(var[0](var[1])), var[2], var[3] if len(var) == 4 else None, self.window)
+                buffer = self.shared.line_buffer(key, self.window)
+            self.lines.append(
+                AppendLine(color=color, window=self.window, buffer=buffer, parent=self.view.scene)
+            )
+            return
+        self._pyramids.append(MinMaxPyramid())
+        self._lod_keys.append(None)
         self.lines.append(
             scene.LinePlot(
                 np.empty((2,1)), 
-                color=COLORS[len(self.lines)%len(COLORS)], 
+                color=color, 
                 marker_size=0, 
                 parent = self.view.scene,
             )
         )
 
     def iterate(self):
+        if self.incremental:
+            self.iterate_incremental()
+            return
         for i, lam in enumerate(self._tracked_vars):
-            x = lam[0](lam[1]).tracked_variables[lam[2]][0]
-            if len(lam) == 4:
-                y = [x.item(lam[3]) for x in lam[0](lam[1]).tracked_variables[lam[2]][1]]
+            x, y = _series(lam, self.snapshot)
+            if x is None:
+                continue
+            if not self.lod:
+                self.lines[i].set_data((x, y), marker_size=0)
             else:
-                y = lam[0](lam[1]).tracked_variables[lam[2]][1]
-            self.lines[i].set_data((x, y), marker_size=0)
+                xd, yd = self._decimate(i, x, y)
+                if xd is not None:
+                    self.lines[i].set_data((xd, yd), marker_size=0)
             if x[-1] > self.maxx:
                 self.maxx = x[-1]
             if x[-1] < self.minx:
@@ -133,21 +324,69 @@ class BaseVispyTS(BaseVispy):
         if self.range_ is None:
             self.view.camera.set_range((self.minx, self.maxx),(self.miny, self.maxy))
 
+    # (None, None) when neither the data nor the visible x range have changed
+    def _decimate(self, i, x, y):
+        if self.range_ is None:
+            x0, x1 = None, None
+        else:
+            rect = self.view.camera.rect
+            x0, x1 = rect.left, rect.right
+        px = int(self.view.size[0]) or 1000
+        key = (len(x), x[-1] if len(x) else None, x0, x1, px)
+        if key == self._lod_keys[i]:
+            return None, None
+        self._lod_keys[i] = key
+        self._pyramids[i].update(x, y)
+        return self._pyramids[i].query(x, y, x0, x1, px)
+
+    # steps only ever increase, so anything past the last step drawn is new
+    def iterate_incremental(self):
+        for i, lam in enumerate(self._tracked_vars):
+            line = self.lines[i]
+            x, y = _series(lam, self.snapshot)
+            if x is None:
+                continue
+            k = np.searchsorted(x, line.last_step, side="right")
+            if k < len(x):
+                line.append(x[k:], y[k:])
+            # from the buffer, which a line sharing it may have appended to instead
+            self.maxx = max(self.maxx, line.buffer.maxx)
+            if self.window is None:
+                self.miny = min(self.miny, line.buffer.miny)
+                self.maxy = max(self.maxy, line.buffer.maxy)
+        if self.window is not None:
+            # the window moves, so its extent is taken from what is currently drawn
+            drawn = [line.data for line in self.lines if len(line.data)]
+            if drawn:
+                self.minx = min(data[0, 0] for data in drawn)
+                self.miny = min(data[:, 1].min() for data in drawn)
+                self.maxy = max(data[:, 1].max() for data in drawn)
+        if self.range_ is None and self.miny <= self.maxy:
+            self.view.camera.set_range((self.minx, self.maxx),(self.miny, self.maxy))
+
     def reset(self):
         self.minx = 0
         self.maxx = 1
         self.maxy = -np.inf
         self.miny = np.inf
+        if self.incremental:
+            for line in self.lines:
+                line.clear()
+        self._lod_keys = [None for _ in self._lod_keys]
         self.iterate()
 
 # Base class for custom plots, or model visualizations if vispy is unsuitable
 class BaseMPL:
     frontend = "matplotlib"
+    # keep updating while the visual's tab or window is hidden
+    always_update = False
+    canvas_class = FigureCanvas
 
     def __init__(self, size=(800, 800), dpi=100):
+        self.snapshot = None
         x, y = size
         self.fig = Figure((x/dpi, y/dpi), dpi)
-        self.canvas = FigureCanvas(self.fig)
+        self.canvas = self.canvas_class(self.fig)
         self.ax = self.fig.add_subplot(111)
 
     # update on custom call and/or on tab switch - used for static plots
@@ -158,16 +397,58 @@ class BaseMPL:
     def iterate(self):
         pass
 
+# Live readout of the core's profiler, redrawn every update_r frames
+class StatsVisual(BaseMPL):
+    def __init__(self, widget, core, update_r=30, size=(800, 400), dpi=100):
+        super().__init__(size, dpi)
+        self.core = core
+        self.update_rate = update_r
+        self.update_i = 0
+        self.fig.patch.set_facecolor("#000000")
+        self.ax.set_axis_off()
+        self.text = self.ax.text(
+            0, 1, "", color="#FFFFFF", family="monospace", fontsize=8, va="top",
+            transform=self.ax.transAxes,
+        )
+
+    def update_triggered(self):
+        if self.core.profiler is None:
+            self.text.set_text("profiling is off")
+        else:
+            self.text.set_text(self.core.profiler.report())
+        self.canvas.draw()
+
+    def iterate(self):
+        self.update_i += 1
+        if self.update_i % self.update_rate == 0:
+            self.update_i = 0
+            self.update_triggered()
+
+    def reset(self):
+        self.update_triggered()
+
 # Base class for easily setting up time series plots
+# lod plots a min/max decimation of about two points per pixel instead of the full history
+# fast keeps the lines and blits them over a cached background, only redrawing the whole
+# figure when the axis limits have to grow
 class BaseTS:
     frontend = "matplotlib"
+    # keep updating while the visual's tab or window is hidden
+    always_update = False
+    canvas_class = FigureCanvas
 
-    def __init__(self, vars_=[], xrange=None, update_r=0, figsize=(800, 800), dpi=100):
+    def __init__(self, vars_=[], xrange=None, update_r=0, figsize=(800, 800), dpi=100, lod=False,
+                 fast=False):
+        self.snapshot = None
         x, y = figsize
         self.fig = Figure((x/dpi, y/dpi), dpi)
-        self.canvas = FigureCanvas(self.fig)
+        self.canvas = self.canvas_class(self.fig)
         self.ax = self.fig.add_subplot(111)
+        self.lod = lod
+        self.fast = fast
+        self._background = None
         self._tracked_vars = []
+        self._pyramids = []
         self.lines = []
         self.update_rate = update_r
         self.update_i = 0
@@ -182,29 +463,49 @@ class BaseTS:
         self.maxx = 1
         self.maxy = -np.inf
         self.miny = np.inf
+        if fast:
+            self.canvas.mpl_connect("draw_event", self._on_draw)
     
     def add_var(self, var):
         self._tracked_vars.append(var)
+        self._pyramids.append(MinMaxPyramid())
+        if self.fast:
+            line = Line2D([], [], color = COLORS[len(self.lines)%len(COLORS)], animated=True)
+            self.ax.add_line(line)
+            self.lines.append(line)
+
+    def _plot_data(self, i, x, y):
+        if not self.lod:
+            return x, y
+        self._pyramids[i].update(x, y)
+        x0, x1 = self.xrange if self.xrange is not None else (None, None)
+        px = int(self.ax.bbox.width) or 1000
+        return self._pyramids[i].query(x, y, x0, x1, px)
+
+    def _extend_range(self, x, y):
+        if x[-1] > self.maxx:
+            self.maxx = x[-1]
+        if x[-1] < self.minx:
+            self.minx = x[-1]
+        if y[-1] > self.maxy:
+            self.maxy = y[-1]
+        if y[-1] < self.miny:
+            self.miny = y[-1]
     
     # override if neccesary
     def update_triggered(self):
-        self.ax.lines = [] 
+        if self.fast:
+            self.update_fast()
+            return
+        for line in list(self.ax.lines):
+            line.remove()
         for i, lam in enumerate(self._tracked_vars):
-            x = lam[0](lam[1]).tracked_variables[lam[2]][0]
-            if len(lam) == 4:
-                y = [x.item(lam[3]) for x in lam[0](lam[1]).tracked_variables[lam[2]][1]]
-            else:
-                y = lam[0](lam[1]).tracked_variables[lam[2]][1]
-            lines = Line2D(x, y, color = COLORS[i%len(COLORS)])
+            x, y = _series(lam, self.snapshot)
+            if x is None:
+                continue
+            lines = Line2D(*self._plot_data(i, x, y), color = COLORS[i%len(COLORS)])
             self.ax.add_line(lines)
-            if x[-1] > self.maxx:
-                self.maxx = x[-1]
-            if x[-1] < self.minx:
-                self.minx = x[-1]
-            if y[-1] > self.maxy:
-                self.maxy = y[-1]
-            if y[-1] < self.miny:
-                self.miny = y[-1]
+            self._extend_range(x, y)
         if self.xrange is not None:
             self.ax.set_xlim(self.xrange)
         else:
@@ -213,11 +514,52 @@ class BaseTS:
         self.canvas.draw()
         self.canvas.flush_events()
 
+    def update_fast(self):
+        for i, lam in enumerate(self._tracked_vars):
+            x, y = _series(lam, self.snapshot)
+            if x is None:
+                continue
+            self.lines[i].set_data(*self._plot_data(i, x, y))
+            self._extend_range(x, y)
+        if self._grow_limits() or self._background is None:
+            # _on_draw caches the new background and draws the lines over it
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            for line in self.lines:
+                self.ax.draw_artist(line)
+            self.canvas.blit(self.ax.bbox)
+        self.canvas.flush_events()
+
+    # limits grow with headroom, so the full redraws get rarer as the run goes on
+    def _grow_limits(self):
+        changed = False
+        x0, x1 = self.ax.get_xlim()
+        if self.xrange is None and not x0 <= self.minx <= self.maxx <= x1:
+            self.ax.set_xlim((self.minx, self.minx + 2 * (self.maxx - self.minx)))
+            changed = True
+        y0, y1 = self.ax.get_ylim()
+        if self.miny <= self.maxy and not y0 <= self.miny <= self.maxy <= y1:
+            pad = 0.1 * (self.maxy - self.miny) or 0.5
+            self.ax.set_ylim((self.miny - pad, self.maxy + pad))
+            changed = True
+        return changed
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+
     def reset(self):
         self.minx = 0
         self.maxx = 1
         self.maxy = -np.inf
         self.miny = np.inf
+        if self.fast:
+            # let the limits grow again from the fresh history
+            self.ax.set_xlim(self.xrange if self.xrange is not None else (0, 1))
+            self.ax.set_ylim((0, 1))
+            self._background = None
         self.update_triggered()
 
     def iterate(self):
@@ -6,7 +6,7 @@ setup(
         version='0.2',
         description='Python Embodied Robotics Framework',
         author='Felix Woolford',
-        packages=find_packages(),
+        packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
         install_requires=[
             'numpy',
             'vispy',